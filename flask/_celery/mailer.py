@@ -0,0 +1,158 @@
+# Соединения с SMTP-сервером для задач отправки почты
+# Установка соединения дорогая: TCP, рукопожатие TLS и авторизация
+# занимают несколько обменов с сервером, а само письмо -- один. Поэтому
+# процесс-работник держит открытые соединения и отправляет через них
+# письма последующих задач.
+# Сервер закрывает простаивающие соединения, поэтому перед
+# использованием соединения, которое долго простаивало, оно проверяется
+# командой NOOP. Если соединение все равно оборвалось при отправке, то
+# письмо отправляется еще раз через новое.
+
+import logging
+import os
+import smtplib
+import threading
+from email.message import EmailMessage
+from time import monotonic
+from typing import Callable, Final, Iterable
+
+LOGGER: Final = logging.getLogger('main.' + __name__)
+
+# Ошибки, после которых соединение нельзя использовать дальше
+_CONN_ERRORS: Final = (smtplib.SMTPServerDisconnected, OSError)
+# Сервер отказался принять письмо, но соединение осталось рабочим
+_REFUSED: Final = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError
+)
+
+
+class SMTPPool:
+    def __init__(self):
+        self.__connect: Callable[[], smtplib.SMTP] | None = None
+        self.__size = 1
+        self.__keepalive = 30.0
+        # Простаивающие соединения и время их последнего использования
+        self.__idle: list[tuple[smtplib.SMTP, float]] = []
+        self.__lock = threading.Lock()
+        self.__pid = os.getpid()
+
+    def init_app(self, app) -> None:
+        config = app.config
+
+        def connect() -> smtplib.SMTP:
+            connection = smtplib.SMTP_SSL(
+                    config['MAIL_SRV'], config['MAIL_PORT'])
+            connection.login(config['MAIL_FROM'], config['MAIL_PASSWD'])
+            return connection
+
+        self.init_connect(
+                connect, config['MAIL_POOL_SIZE'], config['MAIL_KEEPALIVE'])
+
+    def init_connect(
+        self,
+        connect: Callable[[], smtplib.SMTP],
+        size: int = 1,
+        keepalive: float = 30.0
+    ) -> None:
+        """connect -- функция, которая вернет авторизованное соединение."""
+        self.__connect = connect
+        self.__size = size
+        self.__keepalive = keepalive
+
+    def send(self, messages: Iterable[EmailMessage]) -> int:
+        """Отправит письма через одно соединение и вернет число отправленных.
+
+        Письма, которые отклонил сервер, пропускаются.
+        """
+        connection = self.__acquire()
+        sent = 0
+
+        try:
+            for message in messages:
+                try:
+                    connection = self.__send(connection, message)
+                    sent += 1
+                except _REFUSED as error:
+                    LOGGER.warning('Письмо не отправлено: %s', error)
+        except BaseException:
+            _close(connection)
+            raise
+
+        self.__release(connection)
+        return sent
+
+    def close(self) -> None:
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+
+        for connection, _ in idle:
+            _close(connection)
+
+    def __send(
+        self,
+        connection: smtplib.SMTP,
+        message: EmailMessage
+    ) -> smtplib.SMTP:
+        try:
+            connection.send_message(message)
+        except _REFUSED:
+            # SMTPException наследует OSError, но эти ошибки не значат,
+            # что соединение оборвалось
+            raise
+        except _CONN_ERRORS:
+            LOGGER.info('Соединение с SMTP-сервером оборвалось')
+            _close(connection)
+            connection = self.__new()
+            connection.send_message(message)
+
+        return connection
+
+    def __acquire(self) -> smtplib.SMTP:
+        with self.__lock:
+            # Соединения, унаследованные от родительского процесса при
+            # fork(), принадлежат ему: закрывать их нельзя, просто забываем
+            if self.__pid != os.getpid():
+                self.__pid = os.getpid()
+                self.__idle.clear()
+
+            idle = self.__idle.pop() if self.__idle else None
+
+        if idle:
+            connection, last_used = idle
+
+            if monotonic() - last_used < self.__keepalive:
+                return connection
+
+            try:
+                if connection.noop()[0] == 250:
+                    return connection
+            except _CONN_ERRORS:
+                pass
+
+            _close(connection)
+
+        return self.__new()
+
+    def __release(self, connection: smtplib.SMTP) -> None:
+        with self.__lock:
+            if len(self.__idle) < self.__size:
+                self.__idle.append((connection, monotonic()))
+                return
+
+        _close(connection)
+
+    def __new(self) -> smtplib.SMTP:
+        assert self.__connect, 'init_app() was not called'
+        return self.__connect()
+
+
+MAILER: Final = SMTPPool()
+
+
+def _close(connection: smtplib.SMTP) -> None:
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, OSError):
+        connection.close()
@@ -0,0 +1,73 @@
+# Объединение одинаковых задач
+# Задачи без побочных эффектов (например, чтение записей) с одинаковыми
+# аргументами дают один и тот же результат. Поэтому для задачи и ее
+# аргументов в Redis хранится id уже поставленной задачи, и повторный
+# запрос получает его вместо новой задачи. Так одновременные запросы
+# ждут одну и ту же задачу, а завершенные в течение TASK_MEMO_TTL
+# отдают результат из хранилища результатов Celery.
+# Ключ живет TASK_MEMO_TTL с момента постановки задачи, после этого
+# задача будет выполнена заново.
+
+import hashlib
+import json
+import uuid
+from typing import Final
+
+import redis
+from celery import Task, states
+from celery.result import AsyncResult
+
+from cache import CACHE
+
+_MEMO_KEY: Final = 'memo:'
+
+# Запишет новый id, если задачи еще нет или она та, что завершилась
+# ошибкой. Иначе вернет id существующей задачи.
+# KEYS[1] -- ключ задачи
+# ARGV -- новый id, TTL, id задачи с ошибкой или пустая строка
+_CLAIM_LUA: Final = '''
+local current = redis.call('GET', KEYS[1])
+
+if current and current ~= ARGV[3] then
+    return current
+end
+
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+'''
+
+
+class TaskMemo:
+    def __init__(self, client: redis.Redis, ttl: int = 10):
+        self.__client = client
+        self.__ttl = ttl
+        self.__claim = client.register_script(_CLAIM_LUA)
+
+    def init_app(self, app) -> None:
+        self.__ttl = app.config['TASK_MEMO_TTL']
+
+    def delay(self, task: Task, *args: object) -> str:
+        """Поставит задачу, если такой еще нет, и вернет id задачи."""
+        key = _MEMO_KEY + _task_key(task.name, args)
+        task_id = str(uuid.uuid4())
+        failed = ''
+
+        while current := self.__claim(
+                keys=[key], args=[task_id, self.__ttl, failed]):
+            # Ошибку не кэшируем, задачу нужно повторить
+            if AsyncResult(current).state not in states.PROPAGATE_STATES:
+                return current
+
+            failed = current
+
+        task.apply_async(args, task_id=task_id)
+        return task_id
+
+
+MEMO: Final = TaskMemo(CACHE)
+
+
+def _task_key(name: str, args: tuple) -> str:
+    # Одинаковые аргументы всегда дают одну и ту же строку
+    data = json.dumps([name, args], sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()
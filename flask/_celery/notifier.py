@@ -0,0 +1,96 @@
+import json
+import logging
+import queue
+import threading
+from typing import Final
+
+import redis
+from celery import states
+
+LOGGER: Final = logging.getLogger('main.' + __name__)
+
+# Redis-хранилище результатов Celery при каждом сохранении состояния
+# задачи публикует его в канал с тем же именем, что и ключ
+CHANNEL_PREFIX: Final = 'celery-task-meta-'
+# Состояние задачи, которая опубликовала часть результата
+PROGRESS: Final = 'PROGRESS'
+
+
+class TaskNotifier:
+    """Рассылает состояния задач всем, кто их ждет.
+
+    Вместо того чтобы каждый ожидающий опрашивал хранилище результатов
+    или держал свое соединение с ним, весь процесс подписывается на
+    каналы задач один раз. Поток подписки раскладывает сообщения по
+    очередям ожидающих.
+    """
+
+    def __init__(self):
+        self.__client: redis.Redis | None = None
+        self.__waiters: dict[str, list[queue.SimpleQueue]] = {}
+        self.__lock = threading.Lock()
+        self.__thread: threading.Thread | None = None
+
+    def init_app(self, app) -> None:
+        self.init_client(redis.Redis.from_url(
+            app.config['CELERY_PARAMS']['result_backend'],
+            decode_responses=True
+        ))
+
+    def init_client(self, client: redis.Redis) -> None:
+        self.__client = client
+
+    def listen(self, id_: str) -> queue.SimpleQueue:
+        """Вернет очередь, куда будут приходить состояния задачи."""
+        self.__start()
+        events: queue.SimpleQueue = queue.SimpleQueue()
+
+        with self.__lock:
+            self.__waiters.setdefault(id_, []).append(events)
+
+        return events
+
+    def forget(self, id_: str, events: queue.SimpleQueue) -> None:
+        with self.__lock:
+            waiters = self.__waiters.get(id_, [])
+
+            if events in waiters:
+                waiters.remove(events)
+
+            if not waiters:
+                self.__waiters.pop(id_, None)
+
+    def dispatch(self, id_: str, meta: dict) -> None:
+        with self.__lock:
+            waiters = list(self.__waiters.get(id_, ()))
+
+        for events in waiters:
+            events.put(meta)
+
+    def __start(self) -> None:
+        with self.__lock:
+            if self.__thread and self.__thread.is_alive():
+                return
+
+            assert self.__client, 'init_app() was not called'
+
+            pubsub = self.__client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{CHANNEL_PREFIX + '*': self.__handle})
+            # Поток-демон, чтобы не мешать завершению процесса
+            self.__thread = pubsub.run_in_thread(
+                    sleep_time=1.0, daemon=True)
+
+    def __handle(self, message: dict) -> None:
+        id_ = message['channel'][len(CHANNEL_PREFIX):]
+
+        try:
+            meta = json.loads(message['data'])
+        except ValueError:
+            LOGGER.exception('')
+            return
+
+        self.dispatch(id_, meta)
+
+
+def is_ready(meta: dict) -> bool:
+    return meta['status'] in states.READY_STATES
@@ -1,12 +1,33 @@
 # celery -A _celery.provider worker --loglevel INFO
 
-import smtplib
+from collections import deque
 from email.message import EmailMessage
+import io
 import time
 import json
+import uuid
+from typing import Final, Iterator
 
 from celery import shared_task
 from flask import current_app
+from PIL import Image
+
+from api.serialize import get_plan
+from cache import CACHE
+from db import models as dbmodels
+from db.adapter import AlchemyAdpt
+from db.pics import PICS
+from _celery.mailer import MAILER
+from _celery.notifier import PROGRESS
+
+# Письма, ожидающие пакетной отправки
+_OUTBOX_KEY: Final = 'mail:outbox'
+# id задачи, которая отправит накопленные письма
+_FLUSH_KEY: Final = 'mail:flush'
+# Модели, записи которых можно запросить у calc_user, по имени класса
+_ENTITY_MODELS: Final = {
+    model.__name__: model for model in (dbmodels.UserModel, dbmodels.Page)
+}
 
 # Celery полезен для выполнения задач в отдельном процессе, чтобы
 # избежать ограничения параллельного выполнения GIL
@@ -29,14 +50,7 @@ from flask import current_app
 # чтобы получить результат вычислений, которые запросил у сервиса
 
 
-# @shared_task позволяет не привязывать задачу к конкретному
-# экземпляру Celery
-@shared_task(
-    # Сохранять состояние задачи, что позволяет использовать AsyncResult
-    # для получения результата выполнения
-    ignore_result=False
-)
-def mail_send(content: str) -> bool:
+def _make_message(content: str) -> EmailMessage:
     message = EmailMessage()
     # Авторизованный пользователь обязательно должен владеть этим
     # адресом
@@ -44,23 +58,101 @@ def mail_send(content: str) -> bool:
     message['To'] = current_app.config['MAIL_TO']
     message['Subject'] = 'test message'.title()
     message.set_content(content)
+    return message
+
 
+# @shared_task позволяет не привязывать задачу к конкретному
+# экземпляру Celery
+@shared_task(
+    # Сохранять состояние задачи, что позволяет использовать AsyncResult
+    # для получения результата выполнения
+    ignore_result=False
+)
+def mail_send(content: str) -> bool:
     # Использовать SMTP-сервер провайдера почты. Его ИП в белом листе, и
     # с него можно отправлять письма.
 
     # Обычно требуется SSL
     # https://yandex.ru/support/mail/mail-clients/others.html#smtpsetting
 
-    # В конце блока менеджер вызовет connection.quit()
-    with smtplib.SMTP_SSL(current_app.config['MAIL_SRV'], 465) as connection:
-        connection.login(
-            current_app.config['MAIL_FROM'],
-            current_app.config['MAIL_PASSWD']
-        )
-        connection.send_message(message)
-        return True
+    # Соединение не закрывается после отправки, а остается в MAILER для
+    # следующих задач этого процесса
+    return MAILER.send([_make_message(content)]) == 1
+
 
-    return False
+# Пакетная отправка: письма, поставленные в очередь в течение
+# MAIL_BATCH_WINDOW, отправляет одна задача через одно соединение
+def queue_mail(content: str) -> str:
+    """Поставит письмо в очередь и вернет id задачи, которая его отправит."""
+    window = current_app.config['MAIL_BATCH_WINDOW']
+    task_id = str(uuid.uuid4())
+
+    # Первое письмо окна назначает задачу отправки, остальные узнают ее
+    # id. Если задача потеряется, то ключ устареет, и следующее письмо
+    # назначит новую.
+    with CACHE.pipeline() as pipe:
+        pipe.rpush(_OUTBOX_KEY, content)
+        pipe.set(_FLUSH_KEY, task_id, nx=True, ex=max(1, int(window * 10)))
+        pipe.get(_FLUSH_KEY)
+        _, is_first, flush_id = pipe.execute()
+
+    if is_first:
+        mail_flush.apply_async(countdown=window, task_id=task_id)
+
+    return flush_id
+
+
+@shared_task(bind=True, ignore_result=False)
+def mail_flush(self) -> int:
+    # Письма, пришедшие после удаления ключа, отправит следующая задача
+    CACHE.delete(_FLUSH_KEY)
+
+    with CACHE.pipeline() as pipe:
+        pipe.lrange(_OUTBOX_KEY, 0, -1)
+        pipe.delete(_OUTBOX_KEY)
+        contents, _ = pipe.execute()
+
+    pending = deque(contents)
+
+    # MAILER.send() берет следующее письмо, только когда предыдущее
+    # отправлено (или отклонено сервером), поэтому в pending остаются
+    # только неотправленные
+    def messages() -> Iterator[EmailMessage]:
+        while pending:
+            yield _make_message(pending[0])
+            pending.popleft()
+
+    try:
+        return MAILER.send(messages())
+    except OSError as error:
+        # Сервер недоступен: неотправленные письма возвращаются в начало
+        # очереди в прежнем порядке, и задача повторяется
+        if pending:
+            CACHE.lpush(_OUTBOX_KEY, *reversed(pending))
+
+        raise self.retry(exc=error)
+
+
+# Миниатюры строятся после ответа на загрузку, поэтому пользователь не
+# ждет перекодирования картинки. Пока миниатюры нет, отдается оригинал.
+@shared_task
+def make_usr_thumbs(pic_hash: str) -> None:
+    with Image.open(PICS.path(pic_hash)) as image:
+        image.load()
+
+        for size in current_app.config['USR_PIC_SIZES']:
+            # Одинаковые картинки хранятся один раз, и миниатюры для них
+            # могли быть построены раньше
+            if PICS.exists(pic_hash, size):
+                continue
+
+            thumb = image.copy()
+            # Уменьшит с сохранением пропорций, но не увеличит
+            thumb.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+            buffer = io.BytesIO()
+            thumb.save(buffer, 'PNG', optimize=True)
+            PICS.put_thumb(pic_hash, size, buffer.getvalue())
 
 
 @shared_task
@@ -69,9 +161,49 @@ def work() -> bool:
     return True
 
 
-@shared_task(ignore_result=False)
-def calc_user():
-    time.sleep(5)
-    return json.dumps({'result': [
-        {'content': None, 'name': 'Главная', 'path': '/'}
-    ]})
+# Записи читаются частями по TASK_CHUNK_ROWS. Каждая часть сразу
+# публикуется как состояние PROGRESS, поэтому клиент может показать
+# первые строки, не дожидаясь остальных. offset части позволяет
+# поставить ее на место, даже если клиент подключился позже и пропустил
+# предыдущие части. Результат задачи все равно содержит все строки.
+@shared_task(bind=True, ignore_result=False)
+def calc_user(
+    self,
+    model_name: str,
+    limit: int,
+    cursor: int | str | None = None
+) -> str:
+    # Читаются и публикуются только столбцы плана: без хэшей паролей и
+    # двоичных данных. Части уходят клиенту без проверки прав.
+    model = _ENTITY_MODELS[model_name]
+    plan = get_plan(model)
+    pk_name = plan.pk.name
+    chunk_rows = current_app.config['TASK_CHUNK_ROWS']
+    rows: list[dict] = []
+
+    while len(rows) < limit:
+        chunk = [
+            dict(zip(plan.columns, row)) for row in AlchemyAdpt.get_entity(
+                model,
+                limit=min(chunk_rows, limit - len(rows)),
+                after=cursor,
+                columns=list(plan.columns)
+            )
+        ]
+
+        if not chunk:
+            break
+
+        self.update_state(
+                state=PROGRESS, meta={'offset': len(rows), 'rows': chunk})
+        rows.extend(chunk)
+        cursor = chunk[-1][pk_name]
+
+    # Неполная страница -- последняя
+    next_cursor = cursor if rows and len(rows) == limit else None
+
+    return json.dumps({
+        'error': None,
+        'result': rows,
+        'next_cursor': next_cursor
+    }, ensure_ascii=False)
@@ -23,7 +23,10 @@ class PostLoginResp(SuccessResp):
 
 
 class EntityResp(SuccessResp):
-    result: list[dict]
+    # Список записей, либо {столбец: [значения]} для layout=columnar
+    result: list[dict] | dict[str, list]
+    # Передается в параметре cursor, чтобы получить следующую страницу
+    next_cursor: int | str | None = None
 
 
 class PostRefreshResp(SuccessResp):
@@ -36,3 +39,30 @@ class MailSend(BaseModel):
 
 class PostTaskResp(SuccessResp):
     result_id: str
+
+
+class PoolStats(BaseModel):
+    size: int
+    opened: int
+    idle: int
+    hits: int
+    misses: int
+    waits: int
+    hit_rate: float
+    wait_time: float
+
+
+class PoolStatsResp(SuccessResp):
+    stats: PoolStats
+
+
+class QueryStats(BaseModel):
+    count: int
+    total_ms: float
+    # Верхняя граница корзины в миллисекундах -> число запросов
+    buckets: dict[str, int]
+
+
+class QueryStatsResp(SuccessResp):
+    # Текст запроса -> гистограмма времени выполнения
+    stats: dict[str, QueryStats]
@@ -1,5 +1,6 @@
 from typing import Final
 import logging
+import uuid
 
 import flask
 from flask import current_app
@@ -10,11 +11,9 @@ from flask_jwt_extended import (
     create_access_token,
     jwt_required,
     get_jwt,           # payload dict of a current token
-    get_jwt_identity,  # sub из текущего токена
-    decode_token
+    get_jwt_identity   # sub из текущего токена
 )
 import spectree as spec
-import redis
 
 from ._types import (
     ErrorResp,
@@ -24,40 +23,40 @@ from ._types import (
     PostRefreshResp
 )
 from doc import SPEC
+from cache import CACHE
+from ratelimit import LIMITER, by_ip, by_json
 from .bp import API_BP
+from .rtokens import RTokenStore
 
 LOGGER: Final = logging.getLogger('main.' + __name__)
-LOGGER.setLevel(logging.DEBUG)
 
-# sudo docker run -p 6379:6379 -t redis
-CACHE: Final = redis.Redis(host='localhost', decode_responses=True)
 JWT_MAN: Final = JWTManager()
+RTOKENS: Final = RTokenStore(CACHE)
 
 
 # Эта функция будет вызываться для каждого валидного токена, чтобы
 # проверить, находится ли он в блоклисте
 @JWT_MAN.token_in_blocklist_loader
 def check_token_block(header: dict, payload: dict):
-    if payload['type'] != 'refresh' \
-            or CACHE.sismember('tokens', payload['jti']):
-        # Если токен в списке актуальных, то он не в блоклисте
+    if payload['type'] != 'refresh':
+        # Токены доступа нельзя отозвать, Redis для них не нужен
         return False
 
-    if payload['fingerp'] != flask.request.user_agent.string:
-        # Владелец токена изменился
-        LoginMod.del_rtoken()
-
-    for key in CACHE.keys('junk:*'):
-        if CACHE.sismember(key, payload['jti']):
-            # Если токен устарел, то блокируем актуальный
-            LoginMod.del_rtoken(key[5:])
-            break
+    if RTOKENS.is_live(payload['jti']):
+        # Если токен в списке актуальных, то он не в блоклисте
+        return False
 
+    # Устаревший токен использовали повторно. Блокируем актуальный
+    # токен семейства.
+    RTOKENS.revoke(payload['jti'])
     return True
 
 
 # POST, потому что создается новый refresh token
 @API_BP.post('/login')
+# Попытки ограничиваются до валидации тела и проверки пароля
+@LIMITER.limit('login_ip', by_ip)
+@LIMITER.limit('login_email', by_json('email'))
 @SPEC.validate(
     json=PostLogin,
     resp=spec.Response(HTTP_200=PostLoginResp, HTTP_401=ErrorResp),
@@ -130,48 +129,52 @@ class LoginMod(MethodView):
         return SuccessResp()
 
     @classmethod
-    def del_rtoken(cls, token_id: str | None = None):
-        if not token_id:
-            token_id = get_jwt()['jti']
-
-        assert token_id
-        assert CACHE.srem('tokens', token_id) == 1
-
-        junk = CACHE.smembers('junk:' + token_id)
-        CACHE.delete('junk:' + token_id)
-
-        if junk:
-            junk.add(token_id)
-
-        return junk
+    def del_rtoken(cls):
+        RTOKENS.revoke(get_jwt()['jti'])
 
     @classmethod
-    def create_rtoken(cls, usr_id, junk: set | None = None):
+    def create_rtoken(cls, usr_id):
         # Важно делать logout, когда токен больше не нужен, и не делать
         # повторный login вместо обновления. Так злоумышленнику будет
         # тяжелее использовать украденный токен.
 
-        token = create_refresh_token(
-            identity=usr_id,
-            additional_claims={'fingerp': flask.request.user_agent.string}
-        )
-        data = decode_token(token)
-        # jti -- UUID, присвоенный токену,
-        # sub (subject) -- значение identity
-        #LOGGER.debug(data)
-
-        token_id = data['jti']
-        CACHE.sadd('tokens', token_id)
-
-        if junk:
-            CACHE.sadd('junk:' + token_id, *junk)
+        jti, token = cls._new_rtoken(usr_id)
+        RTOKENS.add(jti)
 
         return PostLoginResp(refresh_token=token)
 
     @classmethod
     def upd_rtoken(cls):
-        junk = cls.del_rtoken()
-        return cls.create_rtoken(get_jwt_identity(), junk)
+        jti, token = cls._new_rtoken(get_jwt_identity())
+
+        # Замена выполняется атомарно за один запрос к Redis. Если тот
+        # же токен обновляют одновременно, то успешным будет только
+        # первое обновление, а остальные будут считаться повторным
+        # использованием.
+        # Старые токены семейства остаются в индексе, чтобы можно было
+        # обнаружить их повторное использование
+        if not RTOKENS.rotate(get_jwt()['jti'], jti):
+            return flask.abort(401, 'Token has been revoked')
+
+        return PostLoginResp(refresh_token=token)
+
+    @staticmethod
+    def _new_rtoken(usr_id) -> tuple[str, str]:
+        # jti -- UUID, присвоенный токену,
+        # sub (subject) -- значение identity
+        # Задаем jti сами, чтобы не декодировать только что созданный
+        # токен. Дополнительные поля заменяют стандартные.
+        jti = str(uuid.uuid4())
+
+        token = create_refresh_token(
+            identity=usr_id,
+            additional_claims={
+                'jti': jti,
+                'fingerp': flask.request.user_agent.string
+            }
+        )
+
+        return jti, token
 
 
 API_BP.add_url_rule('/login', view_func=LoginMod.as_view('login_mod'))
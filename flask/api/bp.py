@@ -50,9 +50,19 @@ import spectree as spec
 
 from db import models as dbmodels
 from db import adapter as dbadapter
+from db.trace import TRACE
 import _celery.tasks as ctasks
+from _celery.memo import MEMO
 from doc import SPEC
-from ._types import MailSend, PostTaskResp, EntityResp
+from ._types import (
+    MailSend,
+    PostTaskResp,
+    EntityResp,
+    ErrorResp,
+    PoolStatsResp,
+    QueryStatsResp
+)
+from .serialize import LAYOUTS, get_plan
 from . import ehandlers as eh
 
 API_BP: Final = Blueprint('api', __name__)
@@ -61,7 +71,6 @@ API_BP.register_error_handler(401, eh.handle_401)
 #API_BP.register_error_handler(Exception, eh.handle_error)
 
 LOGGER: Final = logging.getLogger('main.' + __name__)
-LOGGER.setLevel(logging.DEBUG)
 
 
 @API_BP.post('/mail/send')
@@ -85,10 +94,21 @@ LOGGER.setLevel(logging.DEBUG)
 # обертка вернет ответ со статусом 422, генерация исключения не
 # выполнится, поэтому этот случай нельзя обработать в error_handler
 def send_mail():
+    """Отправит письмо в фоне.
+
+    Результат задачи -- True, если письмо отправлено. При
+    MAIL_BATCH_WINDOW письмо отправляет задача пакетной отправки, и ее
+    результат -- число отправленных писем всего пакета.
+    """
     #body: dict = flask.request.json
     # Доступ к типизированным параметрам
     safe_body: MailSend = flask.request.context.json
 
+    if flask.current_app.config['MAIL_BATCH_WINDOW']:
+        # Письмо отправит задача пакетной отправки, ее результат -- число
+        # отправленных писем
+        return PostTaskResp(result_id=ctasks.queue_mail(safe_body.content))
+
     # Отправить сообщение (task message), выполнить задачу в фоне
     result: celery.result.AsyncResult = ctasks.mail_send.delay(
             safe_body.content)
@@ -113,37 +133,74 @@ def get_task_res(id_: str):
 # Class-based (reusable) Views позволяет определить базовый класс с
 # разделяемой логикой для представлений
 
-class EntityView(View):
+class _EntityView(View):
     # View.as_view() создает функцию, которая либо для каждого запроса
     # создает экземпляр этого класса для обработки, либо делает это один
     # раз, если атрибут
     #init_every_request = False
 
     def __init__(self, model):
-        self.__model = model
+        self._model = model
+        # План строится один раз на модель, а не на каждый запрос
+        self._plan = get_plan(model)
+
+    def get_cursor(self):
+        # Курсор -- значение первичного ключа последней полученной
+        # записи, для первой страницы не передается
+        cursor = flask.request.args.get('cursor')
+
+        if cursor is None:
+            return None
+
+        # С type= неправильный курсор молча стал бы первой страницей
+        try:
+            return self._plan.pk.type.python_type(cursor)
+        except ValueError:
+            return flask.abort(400, 'Invalid cursor')
+
+
+class EntityView(_EntityView):
+    """Записи в фоне: задача публикует их частями в /sock/task/<id>."""
 
-    #@SPEC.validate(resp=spec.Response(HTTP_200=EntityResp))
     @SPEC.validate(resp=spec.Response(HTTP_200=PostTaskResp))
     def dispatch_request(self, count: int):
-        result = ctasks.calc_user.delay()
-        return PostTaskResp(result_id=result.id)
+        # Одинаковые запросы получат id одной и той же задачи
+        result_id = MEMO.delay(
+            ctasks.calc_user,
+            self._model.__name__,
+            count,
+            self.get_cursor()
+        )
+        return PostTaskResp(result_id=result_id)
+
 
-        self.set_entities(count)
-        result = []
+class EntityRowsView(_EntityView):
+    """Записи прямо в ответе, формат -- EntityResp."""
 
-        for entity in self.entities:
-            entity_ = {}
+    # Ответ кодируется частями прямо в тело, а не через EntityResp,
+    # поэтому SPEC.validate его не проверяет
+    def dispatch_request(self, count: int):
+        # Формат ответа: records (по умолчанию) или columnar
+        layout = flask.request.args.get('layout', 'records')
 
-            for column in self.__model.__table__.columns:
-                entity_[column.name] = getattr(entity, column.name)
+        if layout not in LAYOUTS:
+            return flask.abort(400, 'Unknown layout')
 
-            result.append(entity_)
+        self.set_entities(count, self.get_cursor())
 
-        return EntityResp(result=result)
+        return flask.Response(
+            self._plan.encode(self.entities, layout, count),
+            mimetype='application/json'
+        )
 
-    def set_entities(self, count: int):
+    def set_entities(self, count: int, cursor: object = None):
         # self при каждом запросе будет новым
-        self.entities = dbadapter.AlchemyAdpt.get_entity(self.__model)[:count]
+        self.entities = dbadapter.AlchemyAdpt.get_entity(
+            self._model,
+            limit=count,
+            after=cursor,
+            columns=list(self._plan.columns)
+        )
 
 
 API_BP.add_url_rule(
@@ -156,6 +213,39 @@ API_BP.add_url_rule(
     view_func=EntityView.as_view('get_pages', dbmodels.Page)
 )
 
+API_BP.add_url_rule(
+    '/db/user/<int:count>/rows',
+    view_func=EntityRowsView.as_view('get_user_rows', dbmodels.UserModel)
+)
+
+API_BP.add_url_rule(
+    '/db/page/<int:count>/rows',
+    view_func=EntityRowsView.as_view('get_page_rows', dbmodels.Page)
+)
+
+
+@API_BP.get('/db/pool')
+@SPEC.validate(resp=spec.Response(HTTP_200=PoolStatsResp, HTTP_404=ErrorResp))
+def get_pool_stats():
+    """Статистика пула соединений с базой данных."""
+    db_adapter = flask.current_app.extensions['db_adapter']
+    stats = db_adapter.get_pool_stats()
+
+    if stats is None:
+        return flask.abort(404, 'The adapter does not use a pool')
+
+    return PoolStatsResp(stats=stats)
+
+
+@API_BP.get('/db/queries')
+@SPEC.validate(resp=spec.Response(HTTP_200=QueryStatsResp, HTTP_404=ErrorResp))
+def get_query_stats():
+    """Гистограммы времени выполнения запросов к базе данных."""
+    if not TRACE.enabled:
+        return flask.abort(404, 'DB_TRACE is disabled')
+
+    return QueryStatsResp(stats=TRACE.stats.get())
+
 
 @API_BP.post('/sum')
 @jwt_required()
@@ -7,7 +7,6 @@ import werkzeug.exceptions as werk_exc
 from ._types import ErrorResp
 
 LOGGER: Final = logging.getLogger('main.' + __name__)
-LOGGER.setLevel(logging.DEBUG)
 
 # Flask автоматически выбрасывает исключение если:
 # - запрос пришел на путь, для которого не определен обработчик (
@@ -0,0 +1,169 @@
+# Хранилище актуальных токенов обновления
+# Токены, выданные при одном входе, образуют семейство: при обновлении
+# старый токен заменяется новым, а семейство остается тем же. Для
+# каждого выданного токена хранится его семейство (обратный индекс
+# jti -> семейство), а для семейства -- jti актуального токена. Так
+# любая проверка стоит фиксированного числа запросов к Redis и не
+# зависит от количества выданных токенов.
+# Все ключи живут не дольше токена обновления, поэтому Redis сам
+# удаляет устаревшие записи.
+
+# Проверка токена нужна на каждый запрос с токеном обновления, поэтому
+# решения (актуален токен или нет) кэшируются в процессе на короткое
+# время. Когда токен перестает быть актуальным, его jti публикуется в
+# канал, и все процессы удаляют решение из своего кэша. Если сообщение
+# потеряется, решение все равно устареет через RTOKEN_CACHE_TTL.
+# Неактуальный токен никогда не станет актуальным снова, поэтому
+# отрицательное решение не нужно инвалидировать.
+
+from datetime import timedelta
+from typing import Final
+import logging
+import threading
+
+import redis
+
+from cache import TTLCache
+
+LOGGER: Final = logging.getLogger('main.' + __name__)
+
+_TOKEN_KEY: Final = 'rtoken:'
+_FAMILY_KEY: Final = 'rfamily:'
+_REVOKED_CHANNEL: Final = 'rtoken:revoked'
+
+# Скрипты выполняются в Redis атомарно: между чтением актуального
+# токена и его заменой никто не сможет изменить семейство
+# KEYS[1] -- ключ токена
+
+# ARGV -- jti
+_IS_LIVE_LUA: Final = f'''
+local family = redis.call('GET', KEYS[1])
+
+if not family then
+    return 0
+end
+
+return redis.call('GET', '{_FAMILY_KEY}' .. family) == ARGV[1] and 1 or 0
+'''
+
+# Вернет отозванный jti
+_REVOKE_LUA: Final = f'''
+local family = redis.call('GET', KEYS[1])
+
+if not family then
+    return false
+end
+
+local family_key = '{_FAMILY_KEY}' .. family
+local live = redis.call('GET', family_key)
+
+if live then
+    redis.call('DEL', family_key)
+    redis.call('PUBLISH', '{_REVOKED_CHANNEL}', live)
+end
+
+return live
+'''
+
+# ARGV -- старый jti, новый jti, TTL
+_ROTATE_LUA: Final = f'''
+local family = redis.call('GET', KEYS[1])
+
+if not family then
+    return 0
+end
+
+local family_key = '{_FAMILY_KEY}' .. family
+local live = redis.call('GET', family_key)
+
+if live ~= ARGV[1] then
+    -- Токен уже заменен, это повторное использование
+    if live then
+        redis.call('DEL', family_key)
+        redis.call('PUBLISH', '{_REVOKED_CHANNEL}', live)
+    end
+
+    return 0
+end
+
+redis.call('SET', family_key, ARGV[2], 'EX', ARGV[3])
+redis.call('SET', '{_TOKEN_KEY}' .. ARGV[2], family, 'EX', ARGV[3])
+redis.call('PUBLISH', '{_REVOKED_CHANNEL}', ARGV[1])
+return 1
+'''
+
+
+class RTokenStore:
+    def __init__(self, client: redis.Redis, ttl: timedelta | None = None):
+        self.__client = client
+        self.__ttl = ttl
+        # Скрипты загружаются в Redis один раз, затем вызываются по хэшу
+        self.__is_live = client.register_script(_IS_LIVE_LUA)
+        self.__revoke = client.register_script(_REVOKE_LUA)
+        self.__rotate = client.register_script(_ROTATE_LUA)
+
+        # jti -> актуален ли токен
+        self.__decisions = TTLCache(10_000, 5.0)
+        self.__lock = threading.Lock()
+        self.__thread: threading.Thread | None = None
+
+    def init_app(self, app) -> None:
+        self.__ttl = app.config['JWT_REFRESH_TOKEN_EXPIRES']
+        self.__decisions = TTLCache(
+            app.config['RTOKEN_CACHE_SIZE'],
+            app.config['RTOKEN_CACHE_TTL']
+        )
+
+    def add(self, jti: str) -> None:
+        """Начнет новое семейство с этим токеном."""
+        # Семейство называется по первому токену
+        # Обе команды отправляются одним запросом
+        with self.__client.pipeline(transaction=False) as pipe:
+            pipe.set(_TOKEN_KEY + jti, jti, ex=self.__ttl)
+            pipe.set(_FAMILY_KEY + jti, jti, ex=self.__ttl)
+            pipe.execute()
+
+    def is_live(self, jti: str) -> bool:
+        self.__subscribe()
+        live = self.__decisions.get(jti)
+
+        if live is None:
+            live = bool(self.__is_live(keys=[_TOKEN_KEY + jti], args=[jti]))
+            self.__decisions.set(jti, live)
+
+        return live
+
+    def rotate(self, old_jti: str, new_jti: str) -> bool:
+        """Заменит актуальный токен семейства на новый.
+
+        Вернет False, если старый токен уже не актуальный. В этом
+        случае семейство будет отозвано.
+        """
+        assert self.__ttl
+        ttl = int(self.__ttl.total_seconds())
+
+        rotated = self.__rotate(
+                keys=[_TOKEN_KEY + old_jti], args=[old_jti, new_jti, ttl])
+
+        # Старый токен в любом случае больше не актуален
+        self.__decisions.set(old_jti, False)
+
+        return bool(rotated)
+
+    def revoke(self, jti: str) -> None:
+        """Отзовет актуальный токен семейства, к которому относится jti."""
+        if live := self.__revoke(keys=[_TOKEN_KEY + jti]):
+            self.__decisions.set(live, False)
+
+    def __subscribe(self) -> None:
+        with self.__lock:
+            if self.__thread and self.__thread.is_alive():
+                return
+
+            pubsub = self.__client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{_REVOKED_CHANNEL: self.__handle_revoked})
+            self.__thread = pubsub.run_in_thread(
+                    sleep_time=1.0, daemon=True)
+
+    def __handle_revoked(self, message: dict) -> None:
+        self.__decisions.set(message['data'], False)
@@ -0,0 +1,107 @@
+# Сериализация записей моделей в JSON
+# Набор и порядок столбцов модели не меняется, поэтому план (какие
+# столбцы читать и как кодировать их имена) строится один раз на модель.
+# Строки кодируются сразу в текст ответа, без промежуточных словарей и
+# валидации Pydantic, и отдаются частями по мере готовности.
+
+import json
+from functools import lru_cache
+from typing import Final, Iterable, Iterator, Sequence
+
+from sqlalchemy import LargeBinary
+
+_ENCODE: Final = json.JSONEncoder(ensure_ascii=False).encode
+# Сколько символов накопить перед отправкой части ответа
+_CHUNK_SIZE: Final = 16 * 1024
+
+LAYOUTS: Final = ('records', 'columnar')
+# Столбцы, которые никогда не покидают сервер
+_HIDDEN: Final = frozenset({'passwd'})
+
+
+class RowPlan:
+    def __init__(self, model):
+        # Двоичные столбцы (картинки) в ответ не попадают, поэтому их не
+        # нужно и читать из базы. Картинка отдается отдельным запросом.
+        # Хэши паролей не читаются совсем.
+        self.columns: Final = tuple(
+            column.name for column in model.__table__.columns
+            if not isinstance(column.type, LargeBinary)
+            and column.name not in _HIDDEN
+        )
+        self.pk: Final = model.__mapper__.primary_key[0]
+        self.__pk_index = self.columns.index(self.pk.name)
+        # Закодированные имена столбцов вместе с двоеточием
+        self.__keys = tuple(_ENCODE(name) + ':' for name in self.columns)
+
+    def encode(
+        self,
+        rows: Sequence[Sequence],
+        layout: str = 'records',
+        limit: int | None = None
+    ) -> Iterator[str]:
+        """Закодирует ответ со строками, прочитанными по self.columns.
+
+        records -- список объектов {столбец: значение},
+        columnar -- объект {столбец: [значения]}, где имена столбцов не
+        повторяются для каждой строки.
+        """
+        # Неполная страница -- последняя
+        next_cursor = None
+
+        if limit and len(rows) == limit:
+            next_cursor = rows[-1][self.__pk_index]
+
+        yield '{"error":null,"result":'
+
+        if layout == 'columnar':
+            yield from self.__columnar(rows)
+        else:
+            yield from _buffer(self.__records(rows))
+
+        yield ',"next_cursor":' + _ENCODE(next_cursor) + '}'
+
+    def record(self, row: Sequence) -> str:
+        return '{' + ','.join(
+                key + _ENCODE(value)
+                for key, value in zip(self.__keys, row)) + '}'
+
+    def __records(self, rows: Iterable[Sequence]) -> Iterator[str]:
+        separator = '['
+
+        for row in rows:
+            yield separator + self.record(row)
+            separator = ','
+
+        yield '[]' if separator == '[' else ']'
+
+    def __columnar(self, rows: Sequence[Sequence]) -> Iterator[str]:
+        # zip(*rows) транспонирует строки в столбцы
+        columns = zip(*rows) if rows else ([] for _ in self.columns)
+
+        yield '{' + ','.join(
+                key + _ENCODE(list(values))
+                for key, values in zip(self.__keys, columns)) + '}'
+
+
+@lru_cache
+def get_plan(model) -> RowPlan:
+    return RowPlan(model)
+
+
+def _buffer(parts: Iterable[str]) -> Iterator[str]:
+    """Объединит мелкие части, чтобы не писать в сокет по одной строке."""
+    chunk: list[str] = []
+    size = 0
+
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+
+        if size >= _CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk.clear()
+            size = 0
+
+    if chunk:
+        yield ''.join(chunk)
@@ -25,13 +25,11 @@
 
 import os
 import logging
-import sys
 from typing import Final
 
 import werkzeug
 from flask import Flask
 import flask_login
-from colorama import Back
 from datetime import datetime
 from flask_migrate import Migrate
 
@@ -39,22 +37,18 @@ from db.adapter import ALCHEMY
 from auth.bp import AUTH_BP, LOGIN_MAN
 from wsite.bp import WSITE_BP
 from api.bp import API_BP
-from api.auth import JWT_MAN
-from fhandlers import SOCK
+from api.auth import JWT_MAN, RTOKENS
+from fhandlers import SOCK, NOTIFIER
+from _celery.memo import MEMO
 from api.ehandlers import handle_error
 import rstapp
 from doc import SPEC
+from logs import LOGS
+from ratelimit import LIMITER
+from cli import PAGES_CLI
 
-FORMATTER: Final = logging.Formatter(
-        Back.MAGENTA + '%(name)s | %(message)s' + Back.RESET)
-
-HANDLER: Final = logging.StreamHandler(sys.stdout)
-HANDLER.setFormatter(FORMATTER)
-HANDLER.setLevel(logging.DEBUG)
-
+# Обработчики и уровень настраивает LOGS по конфигу
 LOGGER: Final = logging.getLogger('main')
-LOGGER.addHandler(HANDLER)
-LOGGER.setLevel(logging.DEBUG)
 
 MIGRATE: Final = Migrate()
 
@@ -70,7 +64,11 @@ def restore_time(time: int) -> str:
 
 
 def create_app():
+    # ALCHEMY подключает rstapp, он нужен и работнику Celery
     app = rstapp.create_app()
+    # Работник Celery журналирование не настраивает: поток записи не
+    # переживет fork() процессов работника
+    LOGS.init_app(app)
 
     # Подключение фильтров
     app.add_template_filter(restore_time, 'restime')
@@ -86,13 +84,19 @@ def create_app():
 
     # Подключение расширений
     LOGIN_MAN.init_app(app)
-    ALCHEMY.init_app(app)
     JWT_MAN.init_app(app)
+    RTOKENS.init_app(app)
     SOCK.init_app(app)
+    NOTIFIER.init_app(app)
+    MEMO.init_app(app)
+    LIMITER.init_app(app)
     MIGRATE.init_app(app, ALCHEMY)
     # Сгенерирует документацию и создаст для нее роуты
     SPEC.register(app)
 
+    # Команды flask pages ...
+    app.cli.add_command(PAGES_CLI)
+
     return app
 
 
@@ -130,5 +134,8 @@ if __name__ == '__main__':
     app.run(
         #debug=True,  # показывать ошибки в браузере
         processes=1,
-        threaded=False
+        # Каждый запрос в своем потоке. Иначе вход, который ждет
+        # хэширования пароля (и любой открытый сокет), останавливает
+        # все остальные запросы.
+        threaded=True
     )
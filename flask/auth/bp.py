@@ -14,9 +14,9 @@ import flask_login
 from forms import LoginForm
 from user import User
 from utils import with_form
+from ratelimit import LIMITER, by_ip, by_form
 
 LOGGER: Final = logging.getLogger('main.' + __name__)
-LOGGER.setLevel(logging.DEBUG)
 
 AUTH_BP: Final = Blueprint(
     'auth',    # имя блюпринта (нужно для ссылки на представления)
@@ -50,7 +50,10 @@ def load_user(usr_id: int) -> None | User:
     db_adapter = current_app.extensions['db_adapter']
     # Функция должна возвращать экземпляр специального класса, который
     # определяет расширение Flask-Login
-    return db_adapter.get_user(id=usr_id)
+    #return db_adapter.get_user(id=usr_id)
+    # Вызывается на каждый запрос, поэтому пользователь берется из кэша
+    # и без лишних столбцов
+    return db_adapter.load_user(usr_id)
     # Теперь можем получить доступ к текущему пользователю
 
 
@@ -75,6 +78,9 @@ def log_teardown(error: BaseException | None) -> None:
 
 
 @AUTH_BP.route('/login', methods=['GET', 'POST'])
+# Ограничиваются только попытки входа (POST), а не показ формы
+@LIMITER.limit('login_ip', by_ip)
+@LIMITER.limit('login_email', by_form('email'))
 def handle_login():
     def get_logged_resp(uname: str):
         # flask.url_for() возвращает путь по имени представления
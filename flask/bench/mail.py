@@ -0,0 +1,94 @@
+# Скорость отправки писем: новое соединение на каждое письмо, пул
+# соединений и пакетная отправка
+# Вместо SMTP-сервера провайдера используется локальный aiosmtpd без TLS
+# и авторизации, поэтому реальная разница будет больше: каждое новое
+# соединение с сервером провайдера стоит еще рукопожатия TLS и LOGIN.
+# pip install aiosmtpd
+# python -m bench.mail [количество писем]
+
+import smtplib
+import sys
+from email.message import EmailMessage
+from time import perf_counter
+
+from aiosmtpd.controller import Controller
+
+from _celery.mailer import SMTPPool
+
+HOST = '127.0.0.1'
+PORT = 8025
+# Сколько писем накапливается за окно пакетной отправки
+BATCH = 50
+
+
+class _Counter:
+    def __init__(self):
+        self.count = 0
+
+    async def handle_DATA(self, server, session, envelope) -> str:
+        self.count += 1
+        return '250 OK'
+
+
+def _message(i: int) -> EmailMessage:
+    message = EmailMessage()
+    message['From'] = 'bench@localhost'
+    message['To'] = 'user@localhost'
+    message['Subject'] = f'message {i}'
+    message.set_content('test')
+    return message
+
+
+def _current(messages: list[EmailMessage]) -> None:
+    # Так mail_send работал раньше
+    for message in messages:
+        with smtplib.SMTP(HOST, PORT) as connection:
+            connection.send_message(message)
+
+
+def _pooled(messages: list[EmailMessage]) -> None:
+    pool = SMTPPool()
+    pool.init_connect(lambda: smtplib.SMTP(HOST, PORT))
+
+    for message in messages:
+        pool.send([message])
+
+    pool.close()
+
+
+def _batched(messages: list[EmailMessage]) -> None:
+    pool = SMTPPool()
+    pool.init_connect(lambda: smtplib.SMTP(HOST, PORT))
+
+    for start in range(0, len(messages), BATCH):
+        pool.send(messages[start:start + BATCH])
+
+    pool.close()
+
+
+def main(count: int):
+    handler = _Counter()
+    controller = Controller(handler, hostname=HOST, port=PORT)
+    controller.start()
+
+    messages = [_message(i) for i in range(count)]
+
+    try:
+        for name, send in (
+            ('current', _current),
+            ('pooled', _pooled),
+            ('batched', _batched)
+        ):
+            handler.count = 0
+            start = perf_counter()
+            send(messages)
+            elapsed = perf_counter() - start
+
+            assert handler.count == count
+            print(f'{name:>8}: {count / elapsed:8,.0f} messages/s')
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,80 @@
+# Нагрузочный тест рассылки результатов задач
+# Каждый ожидающий -- отдельный поток, как обработчик сокета flask_sock.
+# Тест показывает, что все они обходятся одной подпиской Redis, и
+# измеряет доставку, но потоков остается столько же, сколько сокетов.
+# Нужен локальный Redis, который заменяет хранилище результатов Celery:
+# sudo docker run -p 6379:6379 -t redis
+# python -m bench.notifier [количество ожидающих]
+
+import json
+import statistics
+import sys
+import threading
+import uuid
+from time import perf_counter, sleep
+
+import redis
+
+from _celery.notifier import CHANNEL_PREFIX, TaskNotifier, is_ready
+
+
+def main(count: int):
+    client = redis.Redis(decode_responses=True)
+    notifier = TaskNotifier()
+    notifier.init_client(client)
+
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    sent: dict[str, float] = {}
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    # Каждый поток играет роль обработчика сокета
+    def wait(id_: str):
+        events = notifier.listen(id_)
+        ready.release()
+
+        while not is_ready(meta := events.get()):
+            pass
+
+        with lock:
+            latencies.append(perf_counter() - sent[meta['task_id']])
+
+        notifier.forget(id_, events)
+
+    ready = threading.Semaphore(0)
+    threads = [threading.Thread(target=wait, args=[id_]) for id_ in ids]
+
+    for thread in threads:
+        thread.start()
+
+    for _ in ids:
+        ready.acquire()
+
+    # Дать подписке время установиться
+    sleep(0.5)
+    connections = len(client.client_list())
+    thread_count = threading.active_count()
+
+    start = perf_counter()
+
+    # Так Celery публикует результат завершенной задачи
+    for id_ in ids:
+        sent[id_] = perf_counter()
+        client.publish(CHANNEL_PREFIX + id_, json.dumps(
+                {'status': 'SUCCESS', 'result': '{}', 'task_id': id_}))
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = perf_counter() - start
+    latencies.sort()
+
+    print(f'waiters: {count}, threads: {thread_count}, '
+          f'Redis connections: {connections}')
+    print(f'delivered: {count / elapsed:,.0f} results/s')
+    print(f'latency p50: {statistics.median(latencies) * 1000:.2f} ms, '
+          f'p99: {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
@@ -0,0 +1,48 @@
+# Сравнение фабрик строк SQLiteAdpt
+# python -m bench.rows [количество строк]
+
+import sqlite3
+import sys
+from time import perf_counter
+from collections import namedtuple
+
+from db import rows
+
+
+def _uncached_row(cursor, row: tuple):
+    # Так строки создавались раньше: новый класс на каждую строку
+    fields = [column[0] for column in cursor.description]
+    return namedtuple('Row', fields)._make(row)
+
+
+def _fill(connection: sqlite3.Connection, count: int):
+    connection.execute(
+            'CREATE TABLE Page (path TEXT, name TEXT, content TEXT)')
+    connection.executemany(
+        'INSERT INTO Page VALUES (?, ?, ?)',
+        ((f'/page{i}', f'Страница {i}', 'x' * 100) for i in range(count))
+    )
+
+
+def main(count: int):
+    connection = sqlite3.connect(':memory:')
+    _fill(connection, count)
+
+    factories = {'uncached': _uncached_row, **rows.ROW_FACTORIES}
+
+    for name, factory in factories.items():
+        connection.row_factory = factory
+
+        start = perf_counter()
+        result = connection.execute('SELECT * FROM Page').fetchall()
+        elapsed = perf_counter() - start
+
+        # Обращение к значению, чтобы учесть стоимость доступа. Все
+        # строки поддерживают доступ по атрибутам, как в адаптере.
+        assert result[-1].name
+
+        print(f'{name:>10}: {count / elapsed:12,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
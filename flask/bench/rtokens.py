@@ -0,0 +1,95 @@
+# Проверка токена обновления при разном количестве живых токенов
+# Нужен локальный Redis, бенчмарк использует базу 15 и очищает ее
+# python -m bench.rtokens
+
+import uuid
+from datetime import timedelta
+from time import perf_counter
+
+import redis
+
+from api.rtokens import RTokenStore
+
+SIZES = (10_000, 100_000, 1_000_000)
+CHECKS = 200
+# Сколько раз обновлялся каждый токен
+CHAIN = 3
+
+
+def _old_check(client: redis.Redis, jti: str) -> bool:
+    # Так check_token_block работал раньше
+    if client.sismember('tokens', jti):
+        return False
+
+    for key in client.keys('junk:*'):
+        if client.sismember(key, jti):
+            return True
+
+    return True
+
+
+def _new_check(store: RTokenStore, jti: str) -> bool:
+    # Все проверяемые токены разные, поэтому локальный кэш не помогает
+    return not store.is_live(jti)
+
+
+def _fill(client: redis.Redis, count: int) -> list[str]:
+    stale = []
+
+    with client.pipeline(transaction=False) as pipe:
+        for i in range(count):
+            chain = [str(uuid.uuid4()) for _ in range(CHAIN)]
+            live = chain.pop()
+
+            pipe.sadd('tokens', live)
+            pipe.sadd('junk:' + live, *chain)
+
+            family = chain[0]
+
+            for jti in chain:
+                pipe.set('rtoken:' + jti, family)
+
+            pipe.set('rtoken:' + live, family)
+            pipe.set('rfamily:' + family, live)
+
+            if i < CHECKS:
+                stale.append(chain[-1])
+
+            if i % 10_000 == 0:
+                pipe.execute()
+
+        pipe.execute()
+
+    return stale
+
+
+def _measure(check, arg, tokens: list[str]) -> float:
+    start = perf_counter()
+
+    for jti in tokens:
+        assert check(arg, jti)
+
+    return (perf_counter() - start) / len(tokens) * 1000
+
+
+def main():
+    client = redis.Redis(db=15, decode_responses=True)
+    store = RTokenStore(client, timedelta(days=1))
+
+    for size in SIZES:
+        client.flushdb()
+        stale = _fill(client, size)
+
+        # Старая схема сканирует все ключи, поэтому ее меряем на
+        # меньшем числе проверок
+        old = _measure(_old_check, client, stale[:3])
+        new = _measure(_new_check, store, stale)
+
+        print(f'{size:>9,} tokens: KEYS scan {old:10.2f} ms, '
+              f'index {new:.3f} ms per check')
+
+    client.flushdb()
+
+
+if __name__ == '__main__':
+    main()
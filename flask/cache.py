@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Final, Hashable
+import logging
+import threading
+
+import redis
+
+LOGGER: Final = logging.getLogger('main.' + __name__)
+
+# sudo docker run -p 6379:6379 -t redis
+# Соединение устанавливается лениво, при первой команде
+CACHE: Final = redis.Redis(host='localhost', decode_responses=True)
+
+
+class Generation:
+    """Счетчик поколений данных, общий для всех процессов приложения.
+
+    Локальный кэш хранит номер поколения, для которого он был построен.
+    Изменение данных увеличивает счетчик, и кэши во всех процессах
+    становятся неактуальными. Если Redis недоступен, то счетчик
+    работает только в пределах текущего процесса.
+    """
+
+    def __init__(self, key: str, client: redis.Redis | None = None):
+        self.__key = key
+        self.__client = client
+        self.__local = 0
+
+    def get(self) -> tuple[str, int]:
+        # Номер помечается источником, чтобы значения из Redis и
+        # локального счетчика не совпали случайно
+        if self.__client:
+            try:
+                return 'redis', int(self.__client.get(self.__key) or 0)
+            except redis.RedisError:
+                LOGGER.warning('Generation %s: Redis недоступен', self.__key)
+
+        return 'local', self.__local
+
+    def bump(self) -> None:
+        self.__local += 1
+
+        if self.__client:
+            try:
+                self.__client.incr(self.__key)
+            except redis.RedisError:
+                LOGGER.warning('Generation %s: Redis недоступен', self.__key)
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш, записи которого устаревают.
+
+    Подходит для локального кэша в процессе, когда источник данных
+    находится по сети, а небольшое отставание от него допустимо.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.__size = size
+        self.__ttl = ttl
+        # Ключ -> (срок годности, значение), в порядке использования
+        self.__items: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key: Hashable, default: object = None) -> object:
+        with self.__lock:
+            item = self.__items.get(key)
+
+            if item is None:
+                return default
+
+            if item[0] < monotonic():
+                del self.__items[key]
+                return default
+
+            self.__items.move_to_end(key)
+            return item[1]
+
+    def set(self, key: Hashable, value: object) -> None:
+        with self.__lock:
+            self.__items[key] = monotonic() + self.__ttl, value
+            self.__items.move_to_end(key)
+
+            if len(self.__items) > self.__size:
+                # Вытесняем давно не использованную запись
+                self.__items.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self.__lock:
+            self.__items.pop(key, None)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__items.clear()
@@ -0,0 +1,77 @@
+# Команды flask для обслуживания сайта
+# flask --app app:create_app pages export pages.jsonl
+# flask --app app:create_app pages import pages.csv
+# Страницы переносятся потоком: файл читается и пишется построчно, а в
+# базу попадают пачками по PAGE_IMPORT_BATCH, поэтому память не зависит
+# от числа страниц.
+# Формат -- JSON Lines (объект на строку) или CSV с заголовком, поля
+# name, content и необязательный path (без пути он будет получен из
+# имени). Если формат не указан, то он определяется по расширению.
+
+import csv
+import json
+import sys
+from typing import Final, Iterator, TextIO
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+FORMATS: Final = ('jsonl', 'csv')
+_FIELDS: Final = ('path', 'name', 'content')
+
+PAGES_CLI: Final = AppGroup('pages', help='Импорт и экспорт страниц.')
+
+
+@PAGES_CLI.command('import')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format_', type=click.Choice(FORMATS))
+def import_pages(file: TextIO, format_: str | None):
+    """Добавит страницы из FILE, занятые пути пропускаются."""
+    if _get_format(file, format_) == 'csv':
+        # Содержимое страницы может быть больше ограничения поля
+        csv.field_size_limit(sys.maxsize)
+        pages = csv.DictReader(file)
+    else:
+        pages = _read_jsonl(file)
+
+    db_adapter = current_app.extensions['db_adapter']
+
+    # Разметка страниц готовится url_for(), которому нужен запрос
+    with current_app.test_request_context():
+        added = db_adapter.import_pages(pages)
+
+    # Меню в других процессах обновится, только если MENU_GEN_BACKEND
+    # общий (redis)
+    click.echo(f'Добавлено страниц: {added}')
+
+
+@PAGES_CLI.command('export')
+@click.argument('file', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'format_', type=click.Choice(FORMATS))
+def export_pages(file: TextIO, format_: str | None):
+    """Выгрузит все страницы в FILE (по умолчанию в stdout)."""
+    pages = current_app.extensions['db_adapter'].export_pages()
+
+    if _get_format(file, format_) == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(_FIELDS)
+        writer.writerows(pages)
+        return
+
+    for page in pages:
+        file.write(json.dumps(
+                dict(zip(_FIELDS, page)), ensure_ascii=False) + '\n')
+
+
+def _get_format(file: TextIO, format_: str | None) -> str:
+    if format_:
+        return format_
+
+    return 'csv' if file.name.endswith('.csv') else 'jsonl'
+
+
+def _read_jsonl(file: TextIO) -> Iterator[dict]:
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
@@ -1,4 +1,5 @@
 import datetime
+from pathlib import Path
 from typing import Final
 import secrets
 
@@ -7,11 +8,30 @@ import secrets
 # Важно ограничить размер, чтобы злоумышленник не перегружал сервер
 MAX_CONTENT_LENGTH: Final = 1024 * 1024
 DB_NAME: Final = 'example'
+# Директория файлов баз и картинок, общая для сайта и работника Celery.
+# Путь абсолютный и считается от настоящего расположения конфига, а не
+# от instance_path приложения: работник запускается из flask_worker
+# через ссылки, и его instance_path -- flask_worker/instance.
+DATA_DIR: Final = Path(__file__).resolve().parent.parent / 'instance'
 DEBUG: Final = True
 #DEBUG = False
+# Уровень логгеров main.*: при разработке -- все записи
+LOG_LEVEL: Final = 'DEBUG' if DEBUG else 'INFO'
+# Уровни отдельных логгеров, например {'main.db.adapter': 'INFO'}
+LOG_LEVELS: Final[dict[str, str]] = {}
+# Писать записи строками JSON (для сборщиков логов), а не текстом
+LOG_JSON: Final = not DEBUG
 # Требует session.permanent = True, по умолчанию 31 день
 PERMANENT_SESSION_LIFETIME: Final = datetime.timedelta(days=14)
 MAIL_SRV: Final = 'smtp.yandex.ru'
+MAIL_PORT: Final = 465
+# Сколько открытых соединений с SMTP-сервером держит процесс-работник
+MAIL_POOL_SIZE: Final = 1
+# После скольких секунд простоя соединение проверяется командой NOOP
+MAIL_KEEPALIVE: Final = 30.0
+# Окно (в секундах), в течение которого письма копятся для отправки
+# одним пакетом. 0 -- каждое письмо отправляет своя задача
+MAIL_BATCH_WINDOW: Final = 0.0
 # Flask-JWT-Extended
 JWT_SECRET_KEY: Final = secrets.token_hex(8)
 # Если хотим использовать токены обновления, то нужно добавить
@@ -22,3 +42,81 @@ JWT_TOKEN_LOCATION: Final = 'headers'
 JWT_ERROR_MESSAGE_KEY: Final = 'error'
 DB_ADAPTER: Final = 'alchemy'
 #DB_ADAPTER: Final = 'sqlite'
+# Представление строк SQLiteAdpt: namedtuple, row (sqlite3.Row) или
+# slots (запись с __slots__)
+DB_ROW_FACTORY: Final = 'namedtuple'
+# Где хранить счетчик поколений кэша меню: local -- в процессе (один
+# процесс), redis -- общий для всех процессов
+MENU_GEN_BACKEND: Final = 'local'
+# Пул соединений SQLiteAdpt
+DB_POOL_SIZE: Final = 8
+# Сколько секунд ждать свободное соединение
+DB_POOL_TIMEOUT: Final = 5.0
+# Соединение, которое простаивало дольше (в секундах), проверяется
+# перед выдачей
+DB_POOL_CHECK_AFTER: Final = 30.0
+# Размер кэша подготовленных запросов каждого соединения
+DB_STMT_CACHE: Final = 256
+# Выполняются для каждого нового соединения. Режим журнала WAL
+# включает соединение писателя.
+DB_PRAGMAS: Final = {
+    # В режиме WAL безопасно и заметно быстрее FULL
+    'synchronous': 'NORMAL',
+    'mmap_size': 64 * 1024 * 1024,
+    # Отрицательное значение -- размер в КиБ, а не в страницах
+    'cache_size': -16 * 1024
+}
+# Замерять время запросов к базе и писать их в журнал на уровне DEBUG
+DB_TRACE: Final = False
+# Через сколько секунд ожидания результата задачи сокет сверяется с
+# хранилищем результатов, если уведомление не пришло
+TASK_RESULT_RECHECK: Final = 30.0
+# Сколько строк задача читает из базы и публикует за раз
+TASK_CHUNK_ROWS: Final = 100
+# Сколько секунд одинаковые запросы получают уже поставленную задачу
+# вместо новой. Столько же могут отставать от базы прочитанные записи.
+TASK_MEMO_TTL: Final = 10
+# Локальный кэш решений о токенах обновления: размер и время жизни
+# записи (в секундах). Время жизни ограничивает задержку отзыва токена,
+# если уведомление об отзыве не дошло до процесса.
+RTOKEN_CACHE_SIZE: Final = 10_000
+RTOKEN_CACHE_TTL: Final = 5.0
+# Кэш пользователей сессий: размер и время жизни записи (в секундах).
+# Время жизни ограничивает, как долго другие процессы видят старые данные
+# пользователя.
+USER_CACHE_SIZE: Final = 1000
+USER_CACHE_TTL: Final = 30.0
+# Метод хэширования паролей вместе с параметрами, в том виде, в каком
+# werkzeug записывает его в хэш (scrypt:N:r:p или pbkdf2:sha256:итерации).
+# Хэши с другими параметрами обновляются при входе пользователя.
+PASSWD_HASH_METHOD: Final = 'scrypt:32768:8:1'
+PASSWD_SALT_LENGTH: Final = 16
+# Процессы для хэширования и сколько вычислений может ждать сверх них.
+# Если мест нет, то вход отвечает 429.
+PASSWD_HASH_WORKERS: Final = 2
+PASSWD_HASH_QUEUE: Final = 8
+# Процессы хэширования при импорте пользователей, отдельные от
+# процессов проверки паролей при входе
+PASSWD_IMPORT_WORKERS: Final = 1
+# Сколько пользователей добавляется в одной транзакции при импорте
+USER_IMPORT_BATCH: Final = 500
+# Сколько страниц читается или добавляется за раз при импорте и
+# экспорте
+PAGE_IMPORT_BATCH: Final = 1000
+# Ограничения частоты попыток входа: имя -> (сколько попыток подряд,
+# за сколько секунд они восстанавливаются)
+RATE_LIMITS: Final = {
+    'login_ip': (20, 60.0),
+    'login_email': (5, 60.0)
+}
+# Директория хранилища картинок пользователей. Работник строит
+# миниатюры в том же хранилище, куда сайт загружает картинки.
+USR_PIC_DIR: Final = DATA_DIR / 'usr_pics'
+# Сколько секунд браузер может не перепроверять картинку пользователя
+USR_PIC_MAX_AGE: Final = 60
+# Наибольший размер загружаемой картинки в байтах
+USR_PIC_MAX_SIZE: Final = 512 * 1024
+# Наибольшая ширина и высота загружаемой картинки
+USR_PIC_MAX_DIM: Final = 4096
+# Размеры миниатюр, которые фоновая задача строит после загрузки
+USR_PIC_SIZES: Final = (32, 64, 256)
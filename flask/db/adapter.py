@@ -9,43 +9,71 @@
 # доступ к одному контексту приложения.
 
 import sqlite3
+import hashlib
 from contextlib import closing
 import re
 from time import time
 import os
 import logging
-from typing import Final, NamedTuple
+from typing import Final, Iterable, Iterator, NamedTuple, TypeVar
+from itertools import islice
 from pathlib import Path
 
 import flask
-# Хэширование нужно базе, поэтому выполняем хэширование в этом модуле
-from werkzeug.security import generate_password_hash, check_password_hash
 from transliterate import translit
 import sqlalchemy.exc as sa_exc
 
-from user import User
+from user import User, SessionUser
+from cache import CACHE, Generation, TTLCache
 from .models import ALCHEMY, Page, UserModel, Info
+from . import rows
+from .pool import SQLitePool, SQLiteWriter, connect
+from .trace import TRACE
+from .hashing import HASHER
+from .pics import PICS
 
 LOGGER: Final = logging.getLogger('main.' + __name__)
-LOGGER.setLevel(logging.DEBUG)
+
+T = TypeVar('T')
 
 _IMG_NAME_RE: Final = re.compile(
         r'<img\s+([\w="\']+\s+)*src=(?P<name>(\'|")[\w+\.]+\3)')
 
+# Столбцы, добавленные в схему после создания таблиц: таблица ->
+# {столбец: объявление}. CREATE TABLE IF NOT EXISTS не меняет таблицы
+# существующей базы, поэтому эти столбцы добавляются отдельно.
+_ADDED_COLUMNS: Final = {
+    'Page': {'html': 'TEXT'},
+    'User': {'pic_hash': 'TEXT DEFAULT NULL'}
+}
+
 # К хэшу применяется соль, поэтому для одного и того же пароля каждый
 # раз будут получаться разные хэши
 
 # Соль увеличивает комбинаторную сложность подбора пароля методом грубой
 # силы, также помогает избежать проблемы, когда клиент вводит уже
 # занятый пароль
-#LOGGER.debug(generate_password_hash('123'))
-#LOGGER.debug(generate_password_hash('123'))
 
 
 class DBAdapter:
+    # Меню запрашивается каждой HTML-страницей, а меняется только при
+    # добавлении страниц, поэтому кэшируем его в процессе вместе с
+    # номером поколения, для которого оно было прочитано
+    # Кэш общий для всех адаптеров, поэтому обращаемся к нему только
+    # через DBAdapter, а не cls
+    _menu: tuple[tuple[str, int], list] | None = None
+    _menu_gen = Generation('menu:gen')
+    # id -> SessionUser. Пользователь загружается из сессии на каждый
+    # запрос, а меняется редко. Изменения в этом процессе удаляют его
+    # из кэша сразу, а сделанные другими процессами станут видны через
+    # USER_CACHE_TTL.
+    _users = TTLCache(1000, 30.0)
+
     @classmethod
     def recreate(cls):
         cls._recreate()
+        DBAdapter._menu_gen.bump()
+        DBAdapter._users.clear()
 
         cls.add_page('Главная', None, flask.url_for('wsite.handle_index'))
         cls.add_page('Профиль', None, flask.url_for('auth.handle_login'))
@@ -56,10 +84,102 @@ class DBAdapter:
 
     @classmethod
     def get_menu(cls):
+        # Поколение читаем до запроса. Если меню изменится во время
+        # запроса, то сохраненное поколение уже будет старым, и
+        # следующий вызов перечитает меню.
+        gen = DBAdapter._menu_gen.get()
+        cached = DBAdapter._menu
+
+        if cached and cached[0] == gen:
+            return cached[1]
+
+        menu = cls._get_menu()
+
+        if menu is None:
+            # Ошибку не кэшируем
+            return []
+
+        DBAdapter._menu = gen, menu
+        return menu
+
+    @classmethod
+    def _get_menu(cls) -> list | None:
         raise NotImplementedError
 
     @classmethod
     def add_page(cls, name: str, content: str, path: str | None = None):
+        # Разметка страницы готовится один раз при добавлении и
+        # хранится рядом с исходным содержимым
+        added = cls._add_page(
+            path if path else _get_page_path(name),
+            name,
+            content,
+            _render_content(content)
+        )
+
+        if added:
+            DBAdapter._menu_gen.bump()
+
+        return added
+
+    @classmethod
+    def _add_page(cls, path: str, name: str, content: str, html: str):
+        raise NotImplementedError
+
+    @classmethod
+    def import_pages(cls, pages: Iterable[dict]) -> int:
+        """Добавит страницы {name, content[, path]} и вернет их число.
+
+        Страницы добавляются пачками по PAGE_IMPORT_BATCH, каждая
+        пачка -- в своей транзакции. Страницы с уже занятым путем
+        пропускаются. Разметка готовится url_for(), поэтому нужен
+        контекст запроса.
+        """
+        batch_size = flask.current_app.config['PAGE_IMPORT_BATCH']
+        added = 0
+
+        for batch in _batched(pages, batch_size):
+            # Пути страниц без пути транслитерируются одним вызовом
+            paths = iter(_get_page_paths(
+                    [page['name'] for page in batch if not page.get('path')]))
+
+            added += cls._add_pages([
+                RenderedPage(
+                    page.get('path') or next(paths),
+                    page['name'],
+                    page.get('content'),
+                    _render_content(page.get('content'))
+                )
+                for page in batch
+            ])
+
+        # Меню сбрасывается один раз на весь импорт
+        if added:
+            DBAdapter._menu_gen.bump()
+
+        return added
+
+    @classmethod
+    def _add_pages(cls, pages: list[tuple[str, str, str | None, str]]) -> int:
+        raise NotImplementedError
+
+    @classmethod
+    def export_pages(cls) -> Iterator[tuple[str, str, str | None]]:
+        """Вернет все страницы (path, name, content) в порядке путей.
+
+        Страницы читаются пачками по PAGE_IMPORT_BATCH после пути
+        последней прочитанной страницы, поэтому в памяти только одна
+        пачка. Разметка не выгружается, импорт подготовит ее заново.
+        """
+        batch_size = flask.current_app.config['PAGE_IMPORT_BATCH']
+        after = ''
+
+        while batch := cls._get_pages(after, batch_size):
+            yield from batch
+            after = batch[-1][0]
+
+    @classmethod
+    def _get_pages(cls, after: str, limit: int) -> list:
         raise NotImplementedError
 
     @classmethod
@@ -69,10 +189,14 @@ class DBAdapter:
         if not page:
             return None
 
-        while result := _IMG_NAME_RE.search(page.content):
-            name = result.group('name')[1:-1]
-            img_path = flask.url_for('static', filename=name)
-            page.content = page.content.replace(name, img_path)
+        if page.html is None:
+            # Страница добавлена до появления столбца html
+            return RenderedPage(
+                page.path,
+                page.name,
+                page.content,
+                _render_cached(page.path, page.content)
+            )
 
         return page
 
@@ -84,25 +208,109 @@ class DBAdapter:
     def add_user(cls, email: str, passwd: str, is_male: bool):
         raise NotImplementedError
 
+    @classmethod
+    def add_users(
+        cls,
+        users: Iterable[tuple[str, str, bool]],
+        hashed: bool = False
+    ) -> int:
+        """Добавит пользователей (email, пароль, is_male) и вернет их число.
+
+        Пользователи добавляются пачками по USER_IMPORT_BATCH, каждая
+        пачка -- в своей транзакции. Пользователи с уже занятой почтой
+        пропускаются. hashed -- пароли уже хэшированы (перенос из другой
+        базы), иначе они хэшируются всеми процессами HASHER.
+        """
+        batch_size = flask.current_app.config['USER_IMPORT_BATCH']
+        now = int(time())
+        added = 0
+
+        for batch in _batched(users, batch_size):
+            if not hashed:
+                pwhashes = HASHER.hash_many(passwd for _, passwd, _ in batch)
+                batch = [
+                    (email, pwhash, is_male)
+                    for (email, _, is_male), pwhash in zip(batch, pwhashes)
+                ]
+
+            added += cls._add_users(batch, now)
+
+        return added
+
+    @classmethod
+    def _add_users(cls, users: list[tuple[str, str, bool]], time_: int) -> int:
+        raise NotImplementedError
+
+    @classmethod
+    def get_pool_stats(cls) -> dict | None:
+        """Вернет статистику пула соединений, если адаптер его использует."""
+        return None
+
     @classmethod
     def get_user(cls,
                  passwd: str | None = None,
                  **kwargs: object) -> User | None:
         user = cls._get_user(kwargs)
 
+        if not user:
+            return None
+
         # Не нужна проверка пароля
-        # Либо пароль верный
-        if not passwd or user and check_password_hash(user.passwd, passwd):
+        if not passwd:
             return User(user)
 
-        return None
+        # Хэш проверяется в отдельном процессе, поток только ждет
+        if not HASHER.check(user.passwd, passwd):
+            return None
+
+        # Параметры хэширования изменились в конфиге. Пароль известен
+        # только сейчас, поэтому обновить хэш можно только при входе.
+        if HASHER.needs_rehash(user.passwd):
+            cls._set_passwd(user.id, HASHER.hash(passwd))
+
+        return User(user)
 
     @classmethod
     def _get_user(cls, kwargs: dict):
         raise NotImplementedError
 
     @classmethod
-    def set_usr_pic(cls, usr_id: str, picture):
+    def load_user(cls, usr_id: int | str) -> User | None:
+        """Вернет пользователя сессии, по возможности из кэша."""
+        key = str(usr_id)
+        user = DBAdapter._users.get(key)
+
+        if user is None:
+            user = cls._get_session_user(usr_id)
+
+            if user is None:
+                return None
+
+            DBAdapter._users.set(key, user)
+
+        return User(user)
+
+    @classmethod
+    def _get_session_user(cls, usr_id: int | str) -> SessionUser | None:
+        raise NotImplementedError
+
+    @classmethod
+    def forget_user(cls, usr_id: int | str) -> None:
+        """Удалит пользователя из кэша после изменения его данных."""
+        DBAdapter._users.delete(str(usr_id))
+
+    @classmethod
+    def set_usr_pic(cls, usr_id: str, pic_hash: str):
+        updated = cls._set_usr_pic(usr_id, pic_hash)
+        cls.forget_user(usr_id)
+        return updated
+
+    @classmethod
+    def _set_usr_pic(cls, usr_id: str, pic_hash: str):
+        raise NotImplementedError
+
+    @classmethod
+    def _set_passwd(cls, usr_id: int, pwhash: str) -> bool:
         raise NotImplementedError
 
 
@@ -129,7 +337,7 @@ class AlchemyAdpt(DBAdapter):
         ALCHEMY.create_all()
 
     @classmethod
-    def get_menu(cls):
+    def _get_menu(cls):
         # Про новый стиль запросов:
         # https://docs.sqlalchemy.org/en/20/changelog/migration_20.html
         stmt = ALCHEMY.select(Page.name, Page.path)
@@ -147,35 +355,28 @@ class AlchemyAdpt(DBAdapter):
             return rows
         except sa_exc.SQLAlchemyError:
             LOGGER.exception('')
-            return []
+            return None
 
     @classmethod
-    def add_page(cls, name: str, content: str, path: str | None = None):
+    def _add_page(cls, path: str, name: str, content: str, html: str):
         # Создаем запись
         # Не обязательно использовать именованные параметры, можно
         # просто передать кортеж значений в конструктор
-        page = Page(
-            path=path if path else _get_page_path(name),
-            name=name,
-            content=content
-        )
+        page = Page(path=path, name=name, content=content, html=html)
 
         # session создает логическую транзакцию, фиксирует изменения
         # в объектах, запрашивает соединение у Engine, управляет
         # реальной транзакцией
 
         # https://ru.stackoverflow.com/a/1505031/546819
+        # Транзакция отсутствует до изменений и неявно создается после
+        # (cls._get_transaction()). С DB_TRACE ее начало и фиксация
+        # видны в журнале.
         try:
-            LOGGER.debug(
-                'Транзакция отсутствует до изменений: %s',
-                cls._get_transaction()
-            )
             ALCHEMY.session.add(page)
             # Для удаления:
             # session.delete(page) или
             # session.execute( delete(Page).where(...) )
-            LOGGER.debug(
-                    'И неявно создается после: %s', cls._get_transaction())
 
             # Явно поместить сгенерированные операции в реальную
             # транзакцию
@@ -199,8 +400,77 @@ class AlchemyAdpt(DBAdapter):
         return True
 
     @classmethod
-    def get_entity(cls, model):
-        return ALCHEMY.session.scalars(ALCHEMY.select(model)).all()
+    def _add_pages(cls, pages: list[tuple[str, str, str | None, str]]) -> int:
+        try:
+            with cls._get_transaction() or ALCHEMY.session.begin():
+                taken = set(ALCHEMY.session.scalars(
+                    ALCHEMY.select(Page.path)
+                           .where(Page.path.in_([page[0] for page in pages]))
+                ))
+                new: dict[str, tuple] = {}
+
+                # Путь мог повториться и внутри пачки, тогда как и в
+                # SQLite остается первая страница
+                for page in pages:
+                    if page[0] not in taken:
+                        new.setdefault(page[0], page)
+
+                if not new:
+                    return 0
+
+                # Один INSERT с executemany на пачку, без объектов модели
+                ALCHEMY.session.execute(ALCHEMY.insert(Page), [
+                    {'path': path, 'name': name, 'content': content,
+                     'html': html}
+                    for path, name, content, html in new.values()
+                ])
+        except sa_exc.SQLAlchemyError:
+            LOGGER.exception('')
+            return 0
+
+        return len(new)
+
+    @classmethod
+    def _get_pages(cls, after: str, limit: int) -> list:
+        return cls.get_entity(
+                Page, limit, after=after, columns=['path', 'name', 'content'])
+
+    @classmethod
+    def get_entity(
+        cls,
+        model,
+        limit: int | None = None,
+        offset: int | None = None,
+        after: object = None,
+        columns: list[str] | None = None
+    ):
+        """Вернет страницу записей модели, упорядоченных по ключу.
+
+        after -- значение первичного ключа последней записи предыдущей
+        страницы (курсор). В отличие от offset, базе не нужно
+        пропускать предыдущие записи, ключ находится по индексу.
+        columns -- имена столбцов, которые нужно прочитать. Тогда
+        вместо экземпляров модели вернутся строки с этими полями.
+        """
+        pk = model.__mapper__.primary_key[0]
+
+        if columns:
+            stmt = ALCHEMY.select(
+                    *(model.__table__.c[name] for name in columns))
+        else:
+            stmt = ALCHEMY.select(model)
+
+        if after is not None:
+            stmt = stmt.where(pk > after)
+
+        # LIMIT и OFFSET выполняются в базе, поэтому в память попадает
+        # только запрошенная страница
+        stmt = stmt.order_by(pk).offset(offset).limit(limit)
+
+        if columns:
+            return ALCHEMY.session.execute(stmt).all()
+
+        return ALCHEMY.session.scalars(stmt).all()
 
     @classmethod
     def _get_page(cls, name: str):
@@ -251,7 +521,7 @@ class AlchemyAdpt(DBAdapter):
 
         user = UserModel(
             email=email,
-            passwd=generate_password_hash(passwd),
+            passwd=HASHER.hash(passwd),
             time=int(time()),
             # Можем использовать атрибут relationship, чтобы сразу
             # добавить запись в соседнюю таблицу
@@ -273,6 +543,46 @@ class AlchemyAdpt(DBAdapter):
         return True, ''
         # user.id появится **после** комита
 
+    @classmethod
+    def _add_users(cls, users: list[tuple[str, str, bool]], time_: int) -> int:
+        emails = [email for email, _, _ in users]
+
+        try:
+            with cls._get_transaction() or ALCHEMY.session.begin():
+                taken = set(ALCHEMY.session.scalars(
+                    ALCHEMY.select(UserModel.email)
+                           .where(UserModel.email.in_(emails))
+                ))
+                # Почта могла повториться и внутри пачки
+                new = {
+                    email: (pwhash, is_male)
+                    for email, pwhash, is_male in users if email not in taken
+                }
+
+                if not new:
+                    return 0
+
+                # Один INSERT на пачку, а id новых записей возвращает
+                # RETURNING в порядке параметров. Объекты моделей и
+                # relationship не создаются.
+                ids = ALCHEMY.session.scalars(
+                    ALCHEMY.insert(UserModel).returning(
+                            UserModel.id, sort_by_parameter_order=True),
+                    [
+                        {'email': email, 'passwd': pwhash, 'time': time_}
+                        for email, (pwhash, _) in new.items()
+                    ]
+                ).all()
+                ALCHEMY.session.execute(ALCHEMY.insert(Info), [
+                    {'usr_id': id_, 'is_male': is_male}
+                    for id_, (_, is_male) in zip(ids, new.values())
+                ])
+        except sa_exc.SQLAlchemyError:
+            LOGGER.exception('')
+            return 0
+
+        return len(new)
+
     @classmethod
     def _get_user(cls, kwargs: dict):
         # filter_by удобно использовать вместо where как раз в таких
@@ -289,29 +599,45 @@ class AlchemyAdpt(DBAdapter):
                     # LEFT JOIN
                     #.outerjoin(Info, UserModel.id == Info.usr_id)
             )
-            LOGGER.debug(stmt)
+            # str(stmt) компилирует запрос в текст, поэтому не стоит
+            # делать это на каждый вызов. Текст выполненного запроса
+            # пишет в журнал db.trace, если включен DB_TRACE.
 
+            # Транзакция открывается даже при SELECT
             user = ALCHEMY.session.execute(stmt).scalar_one()
         except sa_exc.SQLAlchemyError:
             LOGGER.exception('')
             return None
 
-        LOGGER.debug(
-            'Транзакция открывается даже при SELECT: %s',
-            cls._get_transaction()
+        return user
+
+    @classmethod
+    def _get_session_user(cls, usr_id: int | str) -> SessionUser | None:
+        # Только нужные столбцы, без хэша пароля
+        stmt = (
+            ALCHEMY.select(
+                UserModel.id, UserModel.email, UserModel.time, Info.is_male)
+                .outerjoin(Info, UserModel.id == Info.usr_id)
+                .where(UserModel.id == usr_id)
         )
 
-        return user
+        try:
+            row = ALCHEMY.session.execute(stmt).one_or_none()
+        except sa_exc.SQLAlchemyError:
+            LOGGER.exception('')
+            return None
+
+        return SessionUser._make(row) if row else None
 
     @classmethod
-    def set_usr_pic(cls, usr_id: str, picture):
+    def _set_usr_pic(cls, usr_id: str, pic_hash: str):
         # https://docs.sqlalchemy.org/en/20/core/operators.html#conjunction-operators
         # Если хотим IN оператор в WHERE: User.name.in_(['foo', 'bar'])
         try:
             ALCHEMY.session.execute(
                 ALCHEMY.update(UserModel)
                        .where(UserModel.id == usr_id)
-                       .values(picture=picture)
+                       .values(pic_hash=pic_hash)
             )
             ALCHEMY.session.commit()
         except sa_exc.SQLAlchemyError as error:
@@ -323,6 +649,22 @@ class AlchemyAdpt(DBAdapter):
         # его данные через атрибуты и вызывать session.commit()
         return True
 
+    @classmethod
+    def _set_passwd(cls, usr_id: int, pwhash: str) -> bool:
+        try:
+            ALCHEMY.session.execute(
+                ALCHEMY.update(UserModel)
+                       .where(UserModel.id == usr_id)
+                       .values(passwd=pwhash)
+            )
+            ALCHEMY.session.commit()
+        except sa_exc.SQLAlchemyError:
+            ALCHEMY.session.rollback()
+            LOGGER.exception('')
+            return False
+
+        return True
+
 
 # SQLite база данных поддерживает множество открытых транзакций чтения,
 # но только одну открытую транзакцию записи (в которой изменяются
@@ -335,24 +677,48 @@ class AlchemyAdpt(DBAdapter):
 # Мы должны сразу фиксировать транзакцию, если было изменение днаных,
 # чтобы пользователи из других транзакций не получали исключение
 # connection.in_transaction -- True, если открыта транзакция записи
+
+# Чтобы читатели не ждали писателя, база работает в режиме WAL (
+# Write-Ahead Logging): изменения пишутся в отдельный журнал, и читатели
+# видят последнее зафиксированное состояние.
+# Все изменения выполняет одно соединение писателя по очереди, а чтение
+# идет через пул соединений, открытых только для чтения (mode=ro).
 class SQLiteAdpt(DBAdapter):
-    @staticmethod
-    def named_row_convert(cursor, row: tuple):
-        fields = [column[0] for column in cursor.description]
-        cls = NamedTuple('Row', fields)  # type: ignore[misc]
-        return cls(*row)
+    _pool: SQLitePool
+    _writer: SQLiteWriter
+
+    @classmethod
+    def init_pool(cls, config: flask.Config):
+        cls._pool = SQLitePool(
+            lambda: cls._connect(config, readonly=True),
+            config['DB_POOL_SIZE'],
+            config['DB_POOL_TIMEOUT'],
+            config['DB_POOL_CHECK_AFTER']
+        )
+        cls._writer = SQLiteWriter(lambda: cls._connect(config))
+
+    @classmethod
+    def get_pool_stats(cls):
+        return cls._pool.stats()
 
     @classmethod
     def _recreate(cls):
         db_path = flask.current_app.config['DB_PATH']
 
-        if os.path.isfile(db_path):
-            os.remove(db_path)
+        # Соединения с удаляемой базой больше не нужны
+        _close_conn(None)
+        cls._pool.clear()
+        cls._writer.reset()
+
+        # Вместе с базой удаляем журнал WAL и индекс к нему
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile(f'{db_path}{suffix}'):
+                os.remove(f'{db_path}{suffix}')
 
         cls._create()
 
     @classmethod
-    def get_menu(cls):
+    def _get_menu(cls):
         # Функция для получения информации из базы данных
         # Хорошая практика обрабатывать ошибки запросов здесь и
         # возвращать пустой результат
@@ -364,30 +730,53 @@ class SQLiteAdpt(DBAdapter):
             cursor = cls._get_conn().execute('SELECT path, name FROM Page')
         except sqlite3.Error:
             LOGGER.exception('')
-            return []
+            return None
 
         # Возвращает список строк, которые были получены в результате
         # предыдущего SELECT
         return cursor.fetchall()
 
     @classmethod
-    def add_page(cls, name: str, content: str, path: str | None = None):
+    def _add_page(cls, path: str, name: str, content: str, html: str):
         try:
-            with cls._get_conn() as connection:
-                # Значения пользователя нельзя прямо вставлять в запрос,
-                # вместо этого следует использовать параметры, чтобы
-                # избежать возможных SQL-инъекций
-                # https://docs.python.org/3/library/sqlite3.html#sqlite3-placeholders
-                connection.execute(
-                    'INSERT INTO Page VALUES (?, ?, ?)',
-                    (path if path else _get_page_path(name), name, content)
-                )
+            # Значения пользователя нельзя прямо вставлять в запрос,
+            # вместо этого следует использовать параметры, чтобы
+            # избежать возможных SQL-инъекций
+            # https://docs.python.org/3/library/sqlite3.html#sqlite3-placeholders
+            cls._writer.submit(lambda connection: connection.execute(
+                'INSERT INTO Page VALUES (?, ?, ?, ?)',
+                (path, name, content, html)
+            ))
         except sqlite3.Error:
             LOGGER.exception('')
             return False
 
         return True
 
+    @classmethod
+    def _add_pages(cls, pages: list[tuple[str, str, str | None, str]]) -> int:
+        def insert(connection: sqlite3.Connection) -> int:
+            # Команда подготавливается один раз на всю пачку, а rowcount
+            # executemany -- сумма по всем строкам
+            return connection.executemany(
+                'INSERT OR IGNORE INTO Page VALUES (?, ?, ?, ?)', pages
+            ).rowcount
+
+        try:
+            return cls._writer.submit(insert)
+        except sqlite3.Error:
+            LOGGER.exception('')
+            return 0
+
+    @classmethod
+    def _get_pages(cls, after: str, limit: int) -> list:
+        # Ошибка не глотается, иначе выгрузка молча оборвется
+        return cls._get_conn().execute(
+            'SELECT path, name, content FROM Page WHERE path > ? '
+            'ORDER BY path LIMIT ?',
+            (after, limit)
+        ).fetchall()
+
     @classmethod
     def _get_page(cls, name: str):
         try:
@@ -404,35 +793,32 @@ class SQLiteAdpt(DBAdapter):
         # Пароль нужно хэшировать, чтобы в случае утечки базы данных
         # было значительно тяжелей получить пароли
 
-        connection = cls._get_conn()
-
-        try:
-            # Перед .executescript закрывается открытая транзакция,
-            # поэтому ее нужно открывать
-            # Принимает только строку с запросом, нельзя передать
-            # параметры
-
-            params = dict(
-                email=email,
-                # Для генерации хорошего хэша пароля используется
-                # специальная функция
-                passwd=generate_password_hash(passwd),
-                time=int(time()),
-                is_male=is_male
-            )
+        # Хэширование долгое, поэтому выполняется до постановки в
+        # очередь писателя
+        params = dict(
+            email=email,
+            # Для генерации хорошего хэша пароля используется
+            # специальная функция
+            passwd=HASHER.hash(passwd),
+            time=int(time()),
+            is_male=is_male
+        )
 
-            connection.execute('''
+        def insert(connection: sqlite3.Connection):
+            # Писатель откроет транзакцию и зафиксирует ее, либо
+            # откатит, если возникнет исключение
+            cursor = connection.execute('''
                 INSERT INTO User VALUES (NULL, :email, :passwd, :time, NULL)
             ''', params)
 
-            connection.execute('''
-                INSERT INTO Info VALUES (
-                    (SELECT id FROM User WHERE email = :email),
-                    :is_male
-                )
-            ''', params)
+            # id новой записи известен без повторного поиска по email
+            connection.execute(
+                'INSERT INTO Info VALUES (?, ?)',
+                (cursor.lastrowid, params['is_male'])
+            )
 
-            connection.commit()
+        try:
+            cls._writer.submit(insert)
         except sqlite3.IntegrityError:
             return (
                 False,
@@ -441,12 +827,36 @@ class SQLiteAdpt(DBAdapter):
         except sqlite3.Error:
             LOGGER.exception('')
             return False, ''
-        finally:
-            # Если фиксация выполнилась, то ничего не произойдет
-            connection.rollback()
 
         return True, ''
 
+    @classmethod
+    def _add_users(cls, users: list[tuple[str, str, bool]], time_: int) -> int:
+        def insert(connection: sqlite3.Connection) -> int:
+            infos = []
+
+            # Запрос подготавливается один раз и берется из кэша
+            # соединения, а вставка в открытой транзакции не пишет на
+            # диск до фиксации
+            for email, pwhash, is_male in users:
+                cursor = connection.execute(
+                    'INSERT OR IGNORE INTO User VALUES (NULL, ?, ?, ?, NULL)',
+                    (email, pwhash, time_)
+                )
+
+                # 0 -- почта уже занята
+                if cursor.rowcount:
+                    infos.append((cursor.lastrowid, is_male))
+
+            connection.executemany('INSERT INTO Info VALUES (?, ?)', infos)
+            return len(infos)
+
+        try:
+            return cls._writer.submit(insert)
+        except sqlite3.Error:
+            LOGGER.exception('')
+            return 0
+
     @classmethod
     def _get_user(cls, kwargs: dict):
         filter_ = ', '.join(map(lambda key: key + ' = ?', kwargs.keys()))
@@ -464,94 +874,270 @@ class SQLiteAdpt(DBAdapter):
         return cursor.fetchone()
 
     @classmethod
-    def set_usr_pic(cls, usr_id: str, picture):
+    def _get_session_user(cls, usr_id: int | str) -> SessionUser | None:
         try:
-            with cls._get_conn() as connection:
-                cursor = connection.execute(
-                    'UPDATE User SET picture = ? WHERE id = ?',
-                    (picture, usr_id)
-                )
+            row = cls._get_conn().execute(
+                '''SELECT User.id, email, time, is_male
+                   FROM User LEFT JOIN Info ON Info.user_id = User.id
+                   WHERE User.id = ?''',
+                (usr_id,)
+            ).fetchone()
+        except sqlite3.Error:
+            LOGGER.exception('')
+            return None
+
+        return SessionUser._make(row) if row else None
+
+    @classmethod
+    def _set_usr_pic(cls, usr_id: str, pic_hash: str):
+        # Читатели видят предыдущее состояние, пока запись не будет
+        # зафиксирована
+        try:
+            cls._writer.submit(lambda connection: connection.execute(
+                'UPDATE User SET pic_hash = ? WHERE id = ?',
+                (pic_hash, usr_id)
+            ))
         except sqlite3.Error:
             LOGGER.exception('')
             return False
 
-        #cursor.close()
         return True
 
     @classmethod
-    def _connect(cls):
+    def _set_passwd(cls, usr_id: int, pwhash: str) -> bool:
+        try:
+            cls._writer.submit(lambda connection: connection.execute(
+                'UPDATE User SET passwd = ? WHERE id = ?', (pwhash, usr_id)))
+        except sqlite3.Error:
+            LOGGER.exception('')
+            return False
+
+        return True
+
+    @classmethod
+    def _connect(cls, config: flask.Config, readonly: bool = False):
         #:memory:, чтобы создать базу в памяти
-        conntection = sqlite3.connect(flask.current_app.config['DB_PATH'])
+        if readonly:
+            # URI позволяет передать параметры открытия, mode=ro
+            # запрещает любые изменения через это соединение
+            database = Path(config['DB_PATH']).as_uri() + '?mode=ro'
+            pragmas = config['DB_PRAGMAS']
+        else:
+            database = str(config['DB_PATH'])
+            # Режим журнала хранится в самой базе, поэтому его
+            # достаточно включить писателю
+            pragmas = {'journal_mode': 'WAL', **config['DB_PRAGMAS']}
+
+        conntection = connect(
+            database,
+            # synchronous, mmap_size, cache_size задаются для каждого
+            # соединения один раз при открытии
+            pragmas,
+            config['DB_STMT_CACHE'],
+            uri=readonly,
+            # Если включен DB_TRACE, то соединение замеряет свои запросы
+            factory=TRACE.connection_factory()
+        )
+        TRACE.trace(conntection)
         # Представлять записи, полученные из базы данных, в виде
         # словаря, а не кортежа
         #conntection.row_factory = sqlite3.Row
 
-        conntection.row_factory = cls.named_row_convert
+        # Тип строки создается один раз для каждого набора столбцов
+        conntection.row_factory = rows.get_factory(config['DB_ROW_FACTORY'])
 
         return conntection
 
     @classmethod
     def _get_conn(cls):
+        """Вернет соединение только для чтения."""
         if 'db_conn' not in flask.g:
-            flask.g.db_conn = cls._connect()
+            # Соединение берется из пула на весь контекст приложения
+            flask.g.db_conn = cls._pool.acquire()
 
         return flask.g.db_conn
 
     @classmethod
     def _create(cls):
-        with cls._get_conn() as connection, \
-                closing(connection.cursor()) as cursor:
-            # __exit__() у connection вызывает self.commit() или
-            # self.rollback(), если были исключения, не закрывает
-            # соединение, не подавляет исключения
-
+        def create(connection: sqlite3.Connection):
             # Курсор создается для выполнения запросов и чтения
             # полученных данных
             # Курсор можно использовать повторно (несколько раз
             # вызывать .execute()), но данные предыдущего запроса
             # будут очищены
             # Курсор тоже следует закрывать в конце использования
+            with closing(connection.cursor()) as cursor:
+                cursor.executescript(script)
+                _add_columns(cursor)
+                _move_pictures(cursor)
+
+        # Открыть файл относительно app.root_path
+        # Открыть можно только для чтения
+        # По умолчанию открывает на чтение в бинарном режиме
+        # Есть такой же метод для блюпринта
+        schema = flask.current_app.open_resource(
+            Path('db') / 'schema.sql',
+            mode='r'
+        )
 
-            # Открыть файл относительно app.root_path
-            # Открыть можно только для чтения
-            # По умолчанию открывает на чтение в бинарном режиме
-            # Есть такой же метод для блюпринта
-            schema = flask.current_app.open_resource(
-                Path('db') / 'schema.sql',
-                mode='r'
-            )
+        # Flask/Blueprint.root_path возвращает **абсолютный** путь к
+        # пакету приложения/блюпринта (в котором модуль с определением
+        # приложения/блюпринта)
 
-            # Flask/Blueprint.root_path возвращает **абсолютный** путь к
-            # пакету приложения/блюпринта (в котором модуль с
-            # определением приложения/блюпринта)
+        # Имеется Flask.open_instance_resource(), которая открывает путь
+        # относительно Flask.instance_path
+        # instance_path содержит абсолютный путь к директории с файлами,
+        # которые генерирует приложение. Эта директория может находиться
+        # где угодно, но по умолчанию: Flask.root_path / 'instance'
 
-            # Имеется Flask.open_instance_resource(), которая открывает
-            # путь относительно Flask.instance_path
-            # instance_path содержит абсолютный путь к директории с
-            # файлами, которые генерирует приложение. Эта директория
-            # может находиться где угодно, но по умолчанию:
-            # Flask.root_path / 'instance'
+        with schema:
+            script = schema.read()
 
-            with schema:
-                cursor.executescript(schema.read())
+        # Схему создает писатель, так как читатели не могут изменять
+        # базу и даже создать ее файл
+        cls._writer.submit(create)
+
+
+def _get_columns(cursor: sqlite3.Cursor, table: str) -> set[str]:
+    # Второе поле строки table_info -- имя столбца
+    return {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+
+
+def _add_columns(cursor: sqlite3.Cursor) -> None:
+    for table, columns in _ADDED_COLUMNS.items():
+        existing = _get_columns(cursor, table)
+
+        for name, declaration in columns.items():
+            if name not in existing:
+                LOGGER.info('Adding column %s.%s', table, name)
+                cursor.execute(
+                        f'ALTER TABLE {table} ADD COLUMN {name} {declaration}')
+
+
+def _move_pictures(cursor: sqlite3.Cursor) -> None:
+    # Картинки пользователей раньше хранились в столбце User.picture, а
+    # теперь в хранилище PICS. Так же их переносит миграция Alembic для
+    # базы ALCHEMY.
+    if 'picture' not in _get_columns(cursor, 'User'):
+        return
+
+    LOGGER.info('Moving User.picture to the picture store')
+    pictures = cursor.execute(
+        'SELECT id, picture FROM User WHERE picture IS NOT NULL'
+    ).fetchall()
+
+    for usr_id, picture in pictures:
+        cursor.execute(
+            'UPDATE User SET pic_hash = ? WHERE id = ?',
+            (PICS.put(picture), usr_id)
+        )
+
+    # Без старого столбца INSERT INTO User VALUES (...) снова совпадает
+    # со схемой
+    cursor.execute('ALTER TABLE User DROP COLUMN picture')
 
 
 def _close_conn(error: BaseException | None) -> None:
     if 'db_conn' in flask.g:
-        flask.g.db_conn.close()
-        LOGGER.info('DB connection closed')
+        # Вместо закрытия соединение возвращается в пул
+        SQLiteAdpt._pool.release(flask.g.pop('db_conn'))
+        LOGGER.info('DB connection released')
+
+
+class RenderedPage(NamedTuple):
+    path: str
+    name: str
+    content: str | None
+    html: str
+
+
+def _render_content(content: str | None) -> str:
+    """Заменит имена картинок на пути к статическим файлам."""
+    if not content:
+        return ''
+
+    def replace(match: re.Match) -> str:
+        # Меняем только имя внутри кавычек, остальной тег оставляем
+        tag = match.group(0)
+        name_start = match.start('name') - match.start() + 1
+        name_end = match.end('name') - match.start() - 1
+        img_path = flask.url_for('static', filename=tag[name_start:name_end])
+
+        return tag[:name_start] + img_path + tag[name_end:]
+
+    # Один проход по документу, замененные пути повторно не ищутся
+    return _IMG_NAME_RE.sub(replace, content)
+
+
+# (путь, дайджест содержимого) -> разметка. Изменение страницы даст
+# новый ключ, а сам текст страниц кэш не держит.
+_RENDERED: Final = TTLCache(256, float('inf'))
+
+
+def _render_cached(path: str, content: str | None) -> str:
+    digest = None
+
+    if content:
+        digest = hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+    html = _RENDERED.get((path, digest))
+
+    if html is None:
+        html = _render_content(content)
+        _RENDERED.set((path, digest), html)
+
+    return html
+
+
+def _batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
 def _get_page_path(name: str):
     return '/' + translit(name, 'ru', reversed=True)
 
 
+def _get_page_paths(names: list[str]) -> list[str]:
+    # Транслитерация -- проход по всему тексту, поэтому имена
+    # соединяются в один текст и разделяются обратно. Перевод строки
+    # транслитерация не меняет.
+    if any('\n' in name for name in names):
+        return [_get_page_path(name) for name in names]
+
+    text = translit('\n'.join(names), 'ru', reversed=True)
+    return ['/' + name for name in text.split('\n')] if names else []
+
+
 def init(app: flask.Flask):
+    # До создания соединений
+    TRACE.init_app(app)
+    HASHER.init_app(app)
+    DBAdapter._users = TTLCache(
+            app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+    if app.config['MENU_GEN_BACKEND'] == 'redis':
+        # Несколько процессов узнают об изменении меню через Redis
+        DBAdapter._menu_gen = Generation('menu:gen', CACHE)
+
     match app.config['DB_ADAPTER']:
         case 'alchemy':
             app.extensions['db_adapter'] = AlchemyAdpt
-            app.teardown_appcontext(_close_conn)
         case 'sqlite':
             app.extensions['db_adapter'] = SQLiteAdpt
+            SQLiteAdpt.init_pool(app.config)
+            app.teardown_appcontext(_close_conn)
+
+            # Читатели (mode=ro) не могут создать файл базы, поэтому на
+            # новом экземпляре первое же чтение завершилось бы ошибкой.
+            # Схема создается писателем до первого соединения читателя,
+            # а IF NOT EXISTS не трогает существующую базу.
+            Path(app.config['DB_PATH']).parent.mkdir(
+                    parents=True, exist_ok=True)
+
+            with app.app_context():
+                SQLiteAdpt._create()
         case _:
             raise ValueError
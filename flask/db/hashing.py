@@ -0,0 +1,110 @@
+# Хэширование паролей
+# Функции хэширования паролей специально сделаны медленными, а
+# вычисление держит GIL. Поэтому они выполняются в отдельных процессах,
+# а поток запроса только ждет результат и не мешает другим потокам.
+# Число одновременных вычислений ограничено: если все места заняты, то
+# запрос сразу получает 429, а не копит очередь, которую сервер все
+# равно не успеет обработать.
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Final, Iterable, TypeVar
+
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.security import check_password_hash, generate_password_hash
+
+T = TypeVar('T')
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.__method = 'scrypt:32768:8:1'
+        self.__salt_length = 16
+        self.__workers = 1
+        self.__slots = threading.BoundedSemaphore(1)
+        self.__executor: ProcessPoolExecutor | None = None
+        self.__import_workers = 1
+        self.__import_executor: ProcessPoolExecutor | None = None
+        self.__lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        config = app.config
+        self.__method = config['PASSWD_HASH_METHOD']
+        self.__salt_length = config['PASSWD_SALT_LENGTH']
+        self.__workers = config['PASSWD_HASH_WORKERS']
+        self.__import_workers = config['PASSWD_IMPORT_WORKERS']
+        # Выполняются и ждут своей очереди
+        self.__slots = threading.BoundedSemaphore(
+                self.__workers + config['PASSWD_HASH_QUEUE'])
+
+    def hash(self, passwd: str) -> str:
+        return self.__run(
+            generate_password_hash,
+            passwd,
+            self.__method,
+            self.__salt_length
+        )
+
+    def hash_many(self, passwords: Iterable[str]) -> list[str]:
+        """Хэширует пароли для массового импорта."""
+        # У импорта свои процессы: пачка паролей не встает в очередь
+        # общего пула перед проверками при входе и не занимает мест
+        # семафора, поэтому вход во время импорта не получает 429
+        return list(self.__get_import_executor().map(
+            partial(
+                generate_password_hash,
+                method=self.__method,
+                salt_length=self.__salt_length
+            ),
+            passwords,
+            # Пароли передаются процессам пачками, а не по одному
+            chunksize=64
+        ))
+
+    def check(self, pwhash: str, passwd: str) -> bool:
+        return self.__run(check_password_hash, pwhash, passwd)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """Хэш получен с другими параметрами, чем заданы в конфиге."""
+        # Хэш хранится как метод$соль$хэш, метод включает параметры
+        method, salt, _ = pwhash.split('$', 2)
+        return method != self.__method or len(salt) != self.__salt_length
+
+    def __run(self, func: Callable[..., T], *args: object) -> T:
+        if not self.__slots.acquire(blocking=False):
+            raise TooManyRequests('Too many password checks, try again later')
+
+        try:
+            return self.__get_executor().submit(func, *args).result()
+        finally:
+            self.__slots.release()
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        # Процессы создаются при первом хэшировании, а не при импорте,
+        # поэтому работнику Celery они не нужны
+        with self.__lock:
+            if not self.__executor:
+                self.__executor = _new_executor(self.__workers)
+
+            return self.__executor
+
+    def __get_import_executor(self) -> ProcessPoolExecutor:
+        with self.__lock:
+            if not self.__import_executor:
+                self.__import_executor = _new_executor(self.__import_workers)
+
+            return self.__import_executor
+
+
+HASHER: Final = PasswordHasher()
+
+
+def _new_executor(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        workers,
+        # fork() из процесса с потоками небезопасен, поэтому процессы
+        # создаются отдельным чистым процессом
+        mp_context=multiprocessing.get_context('forkserver')
+    )
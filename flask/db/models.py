@@ -27,7 +27,7 @@ Str50u = Annotated[
     ALCHEMY.mapped_column(ALCHEMY.String(50), unique=True)
 ]
 Str100 = Annotated[str, ALCHEMY.mapped_column(ALCHEMY.String(100))]
-BytesNone = Annotated[bytes, ALCHEMY.mapped_column(default=None)]
+Str64 = Annotated[str, ALCHEMY.mapped_column(ALCHEMY.String(64))]
 UsrFpk = Annotated[
     int,
     ALCHEMY.mapped_column(
@@ -49,6 +49,8 @@ class Page(ALCHEMY.Model):  # type: ignore[name-defined]
     # По умолчанию SQL-тип будет NOT NULL, но это ограничение можно
     # убрать, поправив хинт
     content: sa_orm.Mapped[str | None]
+    # Содержимое, подготовленное для вывода при добавлении страницы
+    html: sa_orm.Mapped[str | None]
 
 
 class UserModel(ALCHEMY.Model):  # type: ignore[name-defined]
@@ -61,7 +63,8 @@ class UserModel(ALCHEMY.Model):  # type: ignore[name-defined]
     email: sa_orm.Mapped[Str50u]
     passwd: sa_orm.Mapped[Str100]
     time: sa_orm.Mapped[int]
-    picture: sa_orm.Mapped[BytesNone | None]
+    # Хэш картинки, сама картинка хранится в файле (db.pics)
+    pic_hash: sa_orm.Mapped[Str64 | None]
 
     # Создаем ссылку на объекты из связанной таблицы, но это не
     # обязательно, можно явно объединять таблицы в запросе
@@ -0,0 +1,196 @@
+# Хранилище картинок пользователей
+# Картинка хранится в файле, имя которого -- хэш содержимого (content
+# addressed storage), а в базе остается только хэш. Так строки
+# пользователей остаются маленькими, одинаковые картинки хранятся один
+# раз, а отдавать файл веб-сервер может без копирования в память
+# процесса (sendfile).
+# Чтобы в одной директории не было слишком много файлов, они
+# раскладываются по поддиректориям по первым символам хэша:
+# ab/cd/abcd....png
+# Уменьшенные копии (миниатюры) лежат рядом: abcd....64.png
+
+import hashlib
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Final
+
+PNG_SIGNATURE: Final = b'\x89PNG\r\n\x1a\n'
+# Сигнатура и первый блок IHDR: длина блока, тип, ширина, высота
+PNG_HEADER_SIZE: Final = 24
+
+
+class BadPicture(ValueError):
+    pass
+
+
+class PicStore:
+    def __init__(self):
+        self.__root: Path | None = None
+
+    def init_app(self, app) -> None:
+        # Абсолютный путь: у сайта и работника разные instance_path
+        self.__root = Path(app.config['USR_PIC_DIR'])
+        self.__root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str, size: int | None = None) -> Path:
+        """Вернет путь к картинке или к ее миниатюре размера size."""
+        assert self.__root, 'init_app() was not called'
+        name = f'{digest}.{size}.png' if size else digest + '.png'
+        return self.__root / digest[:2] / digest[2:4] / name
+
+    def exists(self, digest: str, size: int | None = None) -> bool:
+        return self.path(digest, size).is_file()
+
+    def put(self, data: bytes) -> str:
+        """Сохранит картинку и вернет ее хэш."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+
+        # Файл с таким хэшем уже содержит эти же данные
+        if not path.is_file():
+            _write(path, data)
+
+        return digest
+
+    def put_thumb(self, digest: str, size: int, data: bytes) -> None:
+        _write(self.path(digest, size), data)
+
+    def upload(self, max_size: int, max_dim: int) -> 'PicUpload':
+        """Начнет загрузку картинки, которая пишется в хранилище частями."""
+        assert self.__root, 'init_app() was not called'
+        return PicUpload(self, self.__root, max_size, max_dim)
+
+
+class PicUpload:
+    """Файл загружаемой картинки.
+
+    Части записываются сразу во временный файл хранилища, а хэш и
+    ограничения проверяются по мере поступления данных, поэтому в
+    памяти держится только текущая часть. Нарушение ограничений
+    прерывает загрузку исключением BadPicture.
+    """
+
+    def __init__(self, store: PicStore, root: Path, max_size: int,
+                 max_dim: int):
+        self.__store = store
+        self.__max_size = max_size
+        self.__max_dim = max_dim
+        self.__started = False
+        self.__size = 0
+        self.__header = b''
+        self.__hash = hashlib.sha256()
+
+        # Временный файл в корне хранилища находится на той же файловой
+        # системе, поэтому os.replace() не копирует данные
+        fd, self.__tmp_path = tempfile.mkstemp(dir=root, suffix='.tmp')
+        self.__file = os.fdopen(fd, 'wb')
+
+    def __enter__(self) -> 'PicUpload':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def stream_factory(self, **kwargs: object) -> 'PicUpload':
+        """Вернет файл для парсера формы werkzeug."""
+        # В форме только одно поле с файлом
+        if self.__started:
+            raise BadPicture('Ожидается одна картинка')
+
+        self.__started = True
+        return self
+
+    def write(self, data: bytes) -> int:
+        self.__size += len(data)
+
+        if self.__size > self.__max_size:
+            raise BadPicture(
+                    f'Картинка должна быть не больше {self.__max_size} байт')
+
+        if len(self.__header) < PNG_HEADER_SIZE:
+            self.__header += data[:PNG_HEADER_SIZE - len(self.__header)]
+
+            if len(self.__header) == PNG_HEADER_SIZE:
+                self.__check_header()
+
+        self.__hash.update(data)
+        return self.__file.write(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        # Парсер формы перематывает файл после записи, но читать его
+        # не нужно
+        return 0
+
+    def commit(self) -> str:
+        """Переместит картинку на место и вернет ее хэш."""
+        if len(self.__header) < PNG_HEADER_SIZE:
+            raise BadPicture('Поддерживается только PNG')
+
+        self.__file.close()
+        digest = self.__hash.hexdigest()
+        path = self.__store.path(digest)
+
+        if path.is_file():
+            os.unlink(self.__tmp_path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.__tmp_path, path)
+
+        self.__tmp_path = None
+        return digest
+
+    def close(self) -> None:
+        """Удалит временный файл, если загрузка не завершилась."""
+        self.__file.close()
+
+        if self.__tmp_path:
+            os.unlink(self.__tmp_path)
+            self.__tmp_path = None
+
+    def __check_header(self) -> None:
+        size = read_png_size(self.__header)
+
+        if not size:
+            raise BadPicture('Поддерживается только PNG')
+
+        if max(size) > self.__max_dim:
+            raise BadPicture(
+                    f'Картинка должна быть не больше {self.__max_dim} точек')
+
+
+def read_png_size(header: bytes) -> tuple[int, int] | None:
+    """Вернет ширину и высоту по первым PNG_HEADER_SIZE байтам PNG.
+
+    Если данные не похожи на PNG, то вернет None. Для проверки не нужно
+    читать файл целиком.
+    """
+    if len(header) < PNG_HEADER_SIZE \
+            or not header.startswith(PNG_SIGNATURE) \
+            or header[12:16] != b'IHDR':
+        return None
+
+    # Числа в PNG хранятся в порядке big-endian
+    width, height = struct.unpack('>II', header[16:24])
+    return width, height
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Пишем во временный файл рядом и переименовываем, чтобы читатели
+    # никогда не увидели файл записанным наполовину
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+PICS: Final = PicStore()
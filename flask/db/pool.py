@@ -0,0 +1,258 @@
+# Пул соединений SQLite
+# Открытие соединения требует открыть файл и прочитать схему, а кэш
+# подготовленных запросов (cached_statements) живет внутри соединения.
+# Если закрывать соединение после каждого запроса, то все это теряется,
+# поэтому соединения переиспользуются между контекстами приложения.
+
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Callable, Final, TypeVar
+import logging
+
+LOGGER: Final = logging.getLogger('main.' + __name__)
+
+T = TypeVar('T')
+
+
+class PooledConnection(sqlite3.Connection):
+    # В отличие от sqlite3.Connection, у наследника есть __dict__, куда
+    # пул записывает служебные данные
+    pool_gen: int
+    last_used: float
+
+
+def connect(
+    database: str,
+    pragmas: dict[str, object],
+    cached_statements: int = 128,
+    uri: bool = False,
+    factory: type[PooledConnection] = PooledConnection
+) -> PooledConnection:
+    connection = sqlite3.connect(
+        database,
+        # Соединение будет использоваться разными потоками, но только
+        # одним в каждый момент времени
+        check_same_thread=False,
+        cached_statements=cached_statements,
+        uri=uri,
+        factory=factory
+    )
+
+    # PRAGMA не принимает параметры, значения берутся из конфига
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+    return connection
+
+
+class SQLitePool:
+    """Потокобезопасный пул соединений ограниченного размера."""
+
+    def __init__(
+        self,
+        connect: Callable[[], PooledConnection],
+        size: int,
+        timeout: float,
+        check_after: float
+    ):
+        self.__connect = connect
+        self.__size = size
+        self.__timeout = timeout
+        # Если соединение простаивало дольше, то перед выдачей оно
+        # проверяется запросом
+        self.__check_after = check_after
+
+        # Стек (LIFO), чтобы чаще использовались недавно возвращенные
+        # соединения, а лишние дольше простаивали
+        self.__idle: list[PooledConnection] = []
+        self.__lock = threading.Lock()
+        # Ожидающих будит и возврат соединения, и освобождение места
+        # закрытым соединением
+        self.__available = threading.Condition(self.__lock)
+        self.__opened = 0
+        # Увеличивается в clear(), соединения прошлых поколений
+        # закрываются при возврате
+        self.__gen = 0
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__waits = 0
+        self.__wait_time = 0.0
+
+    def acquire(self) -> PooledConnection:
+        while True:
+            connection = self.__take()
+
+            if self.__is_alive(connection):
+                return connection
+
+            self.__discard(connection)
+
+    def release(self, connection: PooledConnection) -> None:
+        try:
+            # Незафиксированная транзакция не должна попасть к
+            # следующему владельцу соединения
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            LOGGER.exception('')
+            self.__discard(connection)
+            return
+
+        if connection.pool_gen != self.__gen:
+            self.__discard(connection)
+            return
+
+        connection.last_used = monotonic()
+
+        with self.__available:
+            self.__idle.append(connection)
+            self.__available.notify()
+
+    def clear(self) -> None:
+        """Закроет свободные соединения, занятые закроются при возврате."""
+        with self.__lock:
+            self.__gen += 1
+            idle, self.__idle = self.__idle, []
+
+        for connection in idle:
+            self.__discard(connection)
+
+    def stats(self) -> dict[str, object]:
+        with self.__lock:
+            requests = self.__hits + self.__misses + self.__waits
+
+            return {
+                'size': self.__size,
+                'opened': self.__opened,
+                'idle': len(self.__idle),
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'waits': self.__waits,
+                'hit_rate': self.__hits / requests if requests else 0.0,
+                'wait_time': self.__wait_time
+            }
+
+    def __take(self) -> PooledConnection:
+        start = None
+
+        with self.__available:
+            while True:
+                if self.__idle:
+                    connection = self.__idle.pop()
+                    break
+
+                # Место могло освободиться и закрытым соединением, тогда
+                # вместо ожидания открывается новое
+                if self.__opened < self.__size:
+                    self.__opened += 1
+                    connection = None
+                    gen = self.__gen
+                    break
+
+                # Все соединения заняты, ждем, пока какое-нибудь вернут
+                # или закроют
+                if start is None:
+                    start = monotonic()
+
+                remaining = start + self.__timeout - monotonic()
+
+                if remaining <= 0:
+                    self.__count_wait(start)
+                    raise sqlite3.OperationalError(
+                            'Timed out waiting for a pooled connection')
+
+                self.__available.wait(remaining)
+
+            if start is not None:
+                self.__count_wait(start)
+            elif connection:
+                self.__hits += 1
+            else:
+                self.__misses += 1
+
+        if connection:
+            return connection
+
+        try:
+            connection = self.__connect()
+        except BaseException:
+            self.__free_slot()
+            raise
+
+        connection.pool_gen = gen
+        connection.last_used = monotonic()
+        return connection
+
+    def __count_wait(self, start: float) -> None:
+        # Вызывается под блокировкой
+        self.__waits += 1
+        self.__wait_time += monotonic() - start
+
+    def __free_slot(self) -> None:
+        with self.__available:
+            self.__opened -= 1
+            self.__available.notify()
+
+    def __is_alive(self, connection: PooledConnection) -> bool:
+        if monotonic() - connection.last_used < self.__check_after:
+            return True
+
+        try:
+            connection.execute('SELECT 1').fetchone()
+        except sqlite3.Error:
+            LOGGER.warning('Pooled connection is broken, reopening')
+            return False
+
+        return True
+
+    def __discard(self, connection: PooledConnection) -> None:
+        self.__free_slot()
+
+        try:
+            connection.close()
+        except sqlite3.Error:
+            LOGGER.exception('')
+
+
+# SQLite допускает только одну транзакцию записи. Если писать из разных
+# потоков, они будут ждать друг друга на блокировке файла и получать
+# "database is locked". Вместо этого все изменения выполняются по
+# очереди одним потоком через одно соединение, а читатели в режиме WAL
+# видят последнее зафиксированное состояние и не ждут писателя.
+class SQLiteWriter:
+    """Единственное соединение для записи с очередью запросов."""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection]):
+        self.__connect = connect
+        # Один поток -- это и есть очередь
+        self.__executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='sqlite-writer')
+        # Используется только в потоке писателя
+        self.__connection: sqlite3.Connection | None = None
+
+    def submit(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        """Выполнит func в транзакции писателя и вернет результат.
+
+        Исключения из func пробрасываются вызывающему потоку.
+        """
+        return self.__executor.submit(self.__run, func).result()
+
+    def reset(self) -> None:
+        """Закроет соединение, следующая запись откроет новое."""
+        self.__executor.submit(self.__close).result()
+
+    def __run(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        if self.__connection is None:
+            self.__connection = self.__connect()
+
+        # Фиксация при успехе и откат при исключении
+        with self.__connection:
+            return func(self.__connection)
+
+    def __close(self) -> None:
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
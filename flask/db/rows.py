@@ -0,0 +1,87 @@
+# Фабрики строк для sqlite3 (Connection.row_factory)
+# Фабрика вызывается для каждой полученной строки, поэтому создавать
+# в ней новый класс нельзя: это самое дорогое место при чтении. Тип
+# строки зависит только от набора столбцов (cursor.description), поэтому
+# его можно создать один раз и переиспользовать.
+
+import sqlite3
+from collections import namedtuple
+from functools import lru_cache
+from typing import Callable, Final
+
+
+class SlotsRow:
+    """Компактная запись без __dict__ с доступом по атрибутам и ключам."""
+    __slots__: tuple[str, ...] = ()
+
+    def __init__(self, *values: object):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def __getitem__(self, key: int | str):
+        if isinstance(key, int):
+            key = self.__slots__[key]
+
+        return getattr(self, key)
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{field}={getattr(self, field)!r}'
+                           for field in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+
+class AttrRow(sqlite3.Row):
+    """sqlite3.Row, у которого значения доступны и по атрибутам."""
+    __slots__ = ()
+
+    # Вызывается только для отсутствующих атрибутов, поэтому доступ по
+    # ключам и индексам остается на C
+    def __getattr__(self, name: str):
+        try:
+            return self[name]
+        except IndexError:
+            raise AttributeError(name) from None
+
+
+# description -- кортеж из 7-элементных кортежей, где первый элемент
+# имя столбца. Для одного запроса это один и тот же объект, поэтому его
+# удобно использовать как ключ кэша.
+@lru_cache(maxsize=128)
+def _namedtuple_type(description: tuple):
+    return namedtuple('Row', [column[0] for column in description])
+
+
+@lru_cache(maxsize=128)
+def _slots_type(description: tuple):
+    fields = tuple(column[0] for column in description)
+    return type('Row', (SlotsRow,), {'__slots__': fields})
+
+
+def namedtuple_row(cursor: sqlite3.Cursor, row: tuple):
+    return _namedtuple_type(cursor.description)._make(row)
+
+
+def slots_row(cursor: sqlite3.Cursor, row: tuple):
+    return _slots_type(cursor.description)(*row)
+
+
+# sqlite3.Row реализован на C и вообще не создает типов. Адаптер
+# обращается к значениям по атрибутам, поэтому используется AttrRow.
+ROW_FACTORIES: Final[dict[str, Callable]] = {
+    'namedtuple': namedtuple_row,
+    'row': AttrRow,
+    'slots': slots_row
+}
+
+
+def get_factory(name: str) -> Callable:
+    try:
+        return ROW_FACTORIES[name]
+    except KeyError:
+        raise ValueError(f'Unknown row factory: {name}') from None
@@ -1,7 +1,9 @@
 CREATE TABLE IF NOT EXISTS Page (
     path    TEXT PRIMARY KEY,
     name    TEXT NOT NULL,
-    content TEXT
+    content TEXT,
+    -- Содержимое, подготовленное для вывода (пути к картинкам)
+    html    TEXT
 );
 
 CREATE TABLE IF NOT EXISTS User (
@@ -11,7 +13,8 @@ CREATE TABLE IF NOT EXISTS User (
     email   TEXT NOT NULL UNIQUE,
     passwd  TEXT NOT NULL,
     time    INTEGER NOT NULL,
-    picture BLOB DEFAULT NULL
+    -- Хэш картинки в хранилище картинок, сама картинка хранится в файле
+    pic_hash TEXT DEFAULT NULL
 );
 
 CREATE TABLE IF NOT EXISTS Info (
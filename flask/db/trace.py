@@ -0,0 +1,176 @@
+# Трассировка запросов к базе данных
+# Включается DB_TRACE. Тогда для каждого запроса замеряется время
+# выполнения, и оно попадает в гистограмму этого запроса, а текст
+# запроса, параметры и состояние транзакции пишутся в журнал на уровне
+# DEBUG. Аргументы журнала форматируются только если запись будет
+# выведена, поэтому без DEBUG трассировка стоит только замера времени.
+# Когда DB_TRACE выключен, ни обработчики событий, ни обертки соединений
+# не устанавливаются и ничего не стоят.
+
+import bisect
+import logging
+import sqlite3
+import threading
+from time import perf_counter
+from typing import Final
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .pool import PooledConnection
+
+LOGGER: Final = logging.getLogger('main.' + __name__)
+
+# Верхние границы корзин гистограммы в миллисекундах, последняя -- все
+# остальное
+BUCKETS: Final = (0.1, 0.5, 1.0, 5.0, 10.0, 50.0, 100.0, 500.0, 1000.0)
+# Запросы сверх этого числа учитываются вместе, чтобы запросы с
+# подставленными в текст значениями не заполнили память
+_MAX_STATEMENTS: Final = 500
+_OTHER: Final = '<other>'
+
+
+class QueryStats:
+    """Гистограммы времени выполнения запросов, по тексту запроса."""
+
+    def __init__(self):
+        # Запрос -> [число запросов в каждой корзине, ..., сумма времени]
+        self.__stats: dict[str, list] = {}
+        self.__lock = threading.Lock()
+
+    def record(self, statement: str, elapsed: float) -> None:
+        ms = elapsed * 1000
+        bucket = bisect.bisect_left(BUCKETS, ms)
+
+        with self.__lock:
+            stats = self.__stats.get(statement)
+
+            if stats is None:
+                if len(self.__stats) >= _MAX_STATEMENTS:
+                    statement = _OTHER
+
+                stats = self.__stats.setdefault(
+                        statement, [0] * (len(BUCKETS) + 1) + [0.0])
+
+            stats[bucket] += 1
+            stats[-1] += ms
+
+    def get(self) -> dict[str, dict]:
+        with self.__lock:
+            items = [(key, list(stats)) for key, stats in self.__stats.items()]
+
+        return {
+            statement: {
+                'count': sum(stats[:-1]),
+                'total_ms': stats[-1],
+                # Ключ -- верхняя граница корзины
+                'buckets': dict(zip(
+                        [*map(str, BUCKETS), 'inf'], stats[:-1]))
+            }
+            for statement, stats in items
+        }
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__stats.clear()
+
+
+class TracedConnection(PooledConnection):
+    """Соединение SQLite, которое замеряет время своих запросов."""
+
+    def execute(self, sql: str, parameters=(), /) -> sqlite3.Cursor:
+        start = perf_counter()
+
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.__record(sql, parameters, perf_counter() - start)
+
+    def executemany(self, sql: str, parameters, /) -> sqlite3.Cursor:
+        start = perf_counter()
+
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.__record(sql, '<many>', perf_counter() - start)
+
+    def __record(self, sql: str, parameters: object, elapsed: float) -> None:
+        TRACE.stats.record(sql, elapsed)
+        LOGGER.debug(
+            '%.2f ms, in transaction: %s | %s | %r',
+            elapsed * 1000, self.in_transaction, sql, parameters
+        )
+
+
+class DBTrace:
+    def __init__(self):
+        self.stats: Final = QueryStats()
+        self.enabled = False
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config['DB_TRACE']
+
+        if not self.enabled:
+            return
+
+        # Обработчики устанавливаются на класс Engine, поэтому
+        # срабатывают для движка Flask-SQLAlchemy, созданного позже
+        if not event.contains(Engine, 'after_cursor_execute', _after_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_execute)
+            event.listen(Engine, 'begin', _log_begin)
+            event.listen(Engine, 'commit', _log_commit)
+            event.listen(Engine, 'rollback', _log_rollback)
+
+    def connection_factory(self) -> type[PooledConnection]:
+        """Класс соединений SQLite для sqlite3.connect(factory=...)."""
+        if not self.enabled:
+            return PooledConnection
+
+        return TracedConnection
+
+    def trace(self, connection: sqlite3.Connection) -> None:
+        """Будет писать в журнал каждую команду соединения.
+
+        В отличие от обертки execute(), SQLite сообщит и о командах,
+        которые выполняет сам модуль sqlite3: BEGIN, COMMIT, команды
+        executescript(), а значения параметров будут подставлены в текст.
+        """
+        if self.enabled and LOGGER.isEnabledFor(logging.DEBUG):
+            connection.set_trace_callback(_log_sqlite)
+
+
+TRACE: Final = DBTrace()
+
+
+def _log_sqlite(statement: str) -> None:
+    LOGGER.debug('sqlite: %s', statement)
+
+
+def _before_execute(conn, cursor, statement, parameters, context,
+                    executemany) -> None:
+    # Контекст создается для каждого выполнения запроса, поэтому время
+    # не потеряется, даже если запрос завершится ошибкой
+    context.trace_start = perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context,
+                   executemany) -> None:
+    elapsed = perf_counter() - context.trace_start
+    TRACE.stats.record(statement, elapsed)
+    LOGGER.debug(
+        '%.2f ms, in transaction: %s | %s | %r',
+        elapsed * 1000, conn.in_transaction(), statement, parameters
+    )
+
+
+def _log_begin(conn) -> None:
+    LOGGER.debug('BEGIN')
+
+
+def _log_commit(conn) -> None:
+    LOGGER.debug('COMMIT')
+
+
+def _log_rollback(conn) -> None:
+    LOGGER.debug('ROLLBACK')
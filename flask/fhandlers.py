@@ -1,21 +1,56 @@
 from typing import Final
-from logging import getLogger, DEBUG
+from logging import getLogger
 import json
+import queue
 
+from flask import current_app
 from flask_sock import Sock
 import _celery.tasks as ctasks
+from _celery.notifier import PROGRESS, TaskNotifier, is_ready
+from celery import states
 from celery.result import AsyncResult
 
 LOGGER: Final = getLogger('main.' + __name__)
-LOGGER.setLevel(DEBUG)
 
 SOCK: Final = Sock()
+NOTIFIER: Final = TaskNotifier()
 
 
+# Обработчик сокета не блокируется на AsyncResult.get(), который
+# опрашивает хранилище результатов отдельно для каждого сокета, а ждет
+# состояние задачи из общей подписки NOTIFIER. Общие только подписка и
+# соединение с Redis: flask_sock выполняет каждый сокет в своем потоке
+# сервера, и этот поток ждет, пока сокет открыт (сокет закрывается при
+# выходе из обработчика). Чтобы ожидающий сокет не занимал поток, нужен
+# асинхронный сервер (например, gevent).
 @SOCK.route('/sock/task/<id_>')
 def get_task_res(ws, id_):
     LOGGER.debug('START')
-    result = AsyncResult(id_)
-    value = result.get()
-    LOGGER.debug(value)
-    ws.send(value)
+    events = NOTIFIER.listen(id_)
+
+    try:
+        # Подписка оформлена, но задача могла завершиться раньше
+        result = AsyncResult(id_)
+        meta = {'status': result.state, 'result': result.result}
+
+        while not is_ready(meta):
+            if meta['status'] == PROGRESS:
+                # Часть результата: {'offset': ..., 'rows': [...]}
+                ws.send(json.dumps({'error': None, **meta['result']}))
+
+            try:
+                meta = events.get(
+                        timeout=current_app.config['TASK_RESULT_RECHECK'])
+            except queue.Empty:
+                # Сообщение подписки могло потеряться при переподключении
+                # к Redis, поэтому изредка сверяемся с хранилищем
+                meta = {'status': result.state, 'result': result.result}
+    finally:
+        NOTIFIER.forget(id_, events)
+
+    if meta['status'] != states.SUCCESS:
+        ws.send(json.dumps({'error': str(meta['result'])}))
+        return
+
+    LOGGER.debug(meta['result'])
+    ws.send(meta['result'])
@@ -0,0 +1,101 @@
+# Журналирование приложения
+# Обработчик, который пишет в поток или файл, выполняется в том потоке,
+# который вызвал логгер, и держит его (и GIL) на время форматирования и
+# записи. Поэтому логгеры приложения только собирают сообщение и кладут
+# запись в очередь (QueueHandler), а форматирует и пишет ее отдельный
+# поток (QueueListener).
+# Уровни и формат задаются в конфиге: LOG_LEVEL для логгеров main.*,
+# LOG_LEVELS для отдельных логгеров и LOG_JSON для вывода записей
+# строками JSON, которые удобно собирать и разбирать.
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Final
+
+from colorama import Back
+
+_TEXT_FORMAT: Final = Back.MAGENTA + '%(name)s | %(message)s' + Back.RESET
+_EXC_FORMATTER: Final = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'name': record.name,
+            'message': record.getMessage()
+        }
+
+        # Исключение уже отформатировано в _QueueHandler.prepare()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            data['exc'] = record.exc_text
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение собирается в вызывающем потоке: аргументы могут быть
+        # прокси Flask (flask.session), которые доступны только в
+        # контексте запроса этого потока. Поток записи только применяет
+        # формат. В отличие от QueueHandler.prepare(), исключение
+        # остается отдельным полем (exc_text) для JSONFormatter.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+class AsyncLogging:
+    def __init__(self):
+        self.__listener: logging.handlers.QueueListener | None = None
+        # Записи, оставшиеся в очереди, будут записаны при выходе
+        atexit.register(self.stop)
+
+    def init_app(self, app) -> None:
+        config = app.config
+        self.stop()
+
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(
+            JSONFormatter() if config['LOG_JSON']
+            else logging.Formatter(_TEXT_FORMAT)
+        )
+
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        self.__listener = logging.handlers.QueueListener(records, handler)
+        self.__listener.start()
+
+        logger = logging.getLogger('main')
+
+        for old_handler in list(logger.handlers):
+            logger.removeHandler(old_handler)
+
+        logger.addHandler(_QueueHandler(records))
+        logger.setLevel(config['LOG_LEVEL'])
+
+        for name, level in config['LOG_LEVELS'].items():
+            logging.getLogger(name).setLevel(level)
+
+    def stop(self) -> None:
+        """Запишет оставшиеся записи и остановит поток записи."""
+        if self.__listener:
+            self.__listener.stop()
+            self.__listener = None
+
+
+LOGS: Final = AsyncLogging()
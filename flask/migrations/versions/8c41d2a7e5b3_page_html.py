@@ -0,0 +1,27 @@
+"""Page html
+
+Revision ID: 8c41d2a7e5b3
+Revises: 3f20b2c0e1d6
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41d2a7e5b3'
+down_revision = '3f20b2c0e1d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Существующие страницы получат NULL и будут подготовлены при чтении
+    with op.batch_alter_table('page') as batch_op:
+        batch_op.add_column(sa.Column('html', sa.String(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('page') as batch_op:
+        batch_op.drop_column('html')
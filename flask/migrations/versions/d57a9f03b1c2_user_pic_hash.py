@@ -0,0 +1,56 @@
+"""User pic_hash
+
+Revision ID: d57a9f03b1c2
+Revises: 8c41d2a7e5b3
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from db.pics import PICS
+
+
+# revision identifiers, used by Alembic.
+revision = 'd57a9f03b1c2'
+down_revision = '8c41d2a7e5b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(
+                sa.Column('pic_hash', sa.String(length=64), nullable=True))
+
+    # Переносим картинки из базы в хранилище картинок
+    connection = op.get_bind()
+    rows = connection.execute(sa.text(
+            'SELECT id, picture FROM user WHERE picture IS NOT NULL'))
+
+    for usr_id, picture in rows.fetchall():
+        connection.execute(
+            sa.text('UPDATE user SET pic_hash = :pic_hash WHERE id = :id'),
+            {'pic_hash': PICS.put(picture), 'id': usr_id}
+        )
+
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('picture')
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('picture', sa.BLOB(), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(sa.text(
+            'SELECT id, pic_hash FROM user WHERE pic_hash IS NOT NULL'))
+
+    for usr_id, pic_hash in rows.fetchall():
+        connection.execute(
+            sa.text('UPDATE user SET picture = :picture WHERE id = :id'),
+            {'picture': PICS.path(pic_hash).read_bytes(), 'id': usr_id}
+        )
+
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('pic_hash')
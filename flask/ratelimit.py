@@ -0,0 +1,161 @@
+# Ограничение частоты запросов
+# Для каждого ключа (например, IP или email) хранится ведро токенов:
+# запрос забирает токен, а токены восстанавливаются равномерно, пока
+# ведро не заполнится. Так разрешены короткие всплески до размера ведра,
+# а в среднем -- не больше заданной частоты.
+# Ведра хранятся в Redis и общие для всех процессов. Если Redis
+# недоступен, то каждый процесс считает сам, в своей памяти.
+# Проверка выполняется до разбора и валидации запроса, чтобы
+# отклоненный запрос не стоил обращений к базе и хэширования пароля.
+
+from functools import wraps
+from time import time
+from typing import Callable, Final
+import logging
+import math
+import threading
+
+import flask
+import redis
+from werkzeug.exceptions import TooManyRequests
+
+from cache import CACHE, TTLCache
+
+LOGGER: Final = logging.getLogger('main.' + __name__)
+
+_RATE_KEY: Final = 'rate:'
+
+# Вернет 0, если токен взят, иначе через сколько миллисекунд он появится
+# KEYS[1] -- ключ ведра
+# ARGV -- размер ведра, токенов в секунду, текущее время в секундах
+_TAKE_LUA: Final = '''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'time')
+local tokens = tonumber(bucket[1]) or capacity
+local last = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local wait = 0
+
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'time', now)
+-- Полное ведро хранить незачем
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return wait
+'''
+
+
+class RateLimiter:
+    def __init__(self, client: redis.Redis):
+        self.__take = client.register_script(_TAKE_LUA)
+        # Имя ограничения -> (размер ведра, за сколько секунд оно
+        # заполняется)
+        self.__limits: dict[str, tuple[int, float]] = {}
+        # Ведра на случай, когда Redis недоступен: ключ -> (токены, время)
+        self.__local = TTLCache(10_000, 3600.0)
+        self.__lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.__limits = app.config['RATE_LIMITS']
+
+    def take(self, name: str, key: str) -> float:
+        """Заберет токен для ключа.
+
+        Вернет 0, если токен был, иначе через сколько секунд он появится.
+        """
+        capacity, period = self.__limits[name]
+        rate = capacity / period
+        key = f'{_RATE_KEY}{name}:{key}'
+        now = time()
+
+        try:
+            wait = self.__take(keys=[key], args=[capacity, rate, now])
+            return wait / 1000
+        except redis.RedisError:
+            LOGGER.warning('RateLimiter: Redis недоступен')
+
+        return self.__take_local(key, capacity, rate, now)
+
+    def limit(
+        self,
+        name: str,
+        key_func: Callable[[], str | None],
+        methods: tuple[str, ...] = ('POST',)
+    ):
+        """Декоратор, который ответит 429, если токенов для ключа нет.
+
+        key_func вернет ключ из запроса, None -- не ограничивать.
+        """
+        def decorator(view):
+            @wraps(view)
+            def view_(*args, **kwargs):
+                key = None
+
+                if flask.request.method in methods:
+                    key = key_func()
+
+                if key is not None and (wait := self.take(name, key)):
+                    raise TooManyRequests(
+                        'Too many attempts, try again later',
+                        retry_after=math.ceil(wait)
+                    )
+
+                return view(*args, **kwargs)
+
+            return view_
+
+        return decorator
+
+    def __take_local(
+        self,
+        key: str,
+        capacity: int,
+        rate: float,
+        now: float
+    ) -> float:
+        with self.__lock:
+            tokens, last = self.__local.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - last) * rate)
+            wait = 0.0
+
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+
+            self.__local.set(key, (tokens, now))
+
+        return wait
+
+
+LIMITER: Final = RateLimiter(CACHE)
+
+
+def by_ip() -> str | None:
+    return flask.request.remote_addr
+
+
+def by_form(field: str) -> Callable[[], str | None]:
+    def get_key() -> str | None:
+        value = flask.request.form.get(field)
+        return value.strip().lower() if value else None
+
+    return get_key
+
+
+def by_json(field: str) -> Callable[[], str | None]:
+    def get_key() -> str | None:
+        # Тело еще не проверено, поэтому может быть чем угодно
+        body = flask.request.get_json(silent=True)
+        value = body.get(field) if isinstance(body, dict) else None
+        return value.strip().lower() if isinstance(value, str) else None
+
+    return get_key
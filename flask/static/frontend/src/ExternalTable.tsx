@@ -32,6 +32,18 @@ function useTaskResult(queryKey: any, taskId: string) {
         const socket = new WebSocket('ws://127.0.0.1:5000/sock/task/' + taskId);
         socket.onmessage = message => {
             const data = JSON.parse(message.data);
+
+            // Часть строк, пока задача еще выполняется. Итоговое
+            // сообщение содержит все строки и заменит накопленные.
+            if (data.rows) {
+                setResult(prev => {
+                    const rows = prev ? [...prev.result] : [];
+                    rows.splice(data.offset, data.rows.length, ...data.rows);
+                    return {error: null, result: rows};
+                });
+                return;
+            }
+
             setResult(data);
             CACHE[cacheKey] = [taskId, data];
         }
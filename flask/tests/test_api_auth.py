@@ -23,3 +23,40 @@ def test_atoken_refresh(client, rtoken, atoken):
     })
 
     assert response.json['access_token'] != atoken
+
+
+def test_api_rtoken_reuse(client, rtoken):
+    response = client.put('/api/login', headers={
+        'authorization': 'Bearer ' + rtoken
+    })
+    new_rtoken = response.json['refresh_token']
+
+    # Повторное использование устаревшего токена
+    response = client.put('/api/login', headers={
+        'authorization': 'Bearer ' + rtoken
+    })
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    # блокирует и актуальный токен семейства
+    response = client.put('/api/login', headers={
+        'authorization': 'Bearer ' + new_rtoken
+    })
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_api_rtoken_other_agent(client, rtoken):
+    # Актуальный токен принимается и от другого клиента
+    response = client.post('/api/refresh', headers={
+        'authorization': 'Bearer ' + rtoken,
+        'user-agent': 'other'
+    })
+
+    assert response.status_code == HTTPStatus.OK
+
+    response = client.put('/api/login', headers={
+        'authorization': 'Bearer ' + rtoken
+    })
+
+    assert response.status_code == HTTPStatus.OK
@@ -0,0 +1,34 @@
+import csv
+import json
+
+
+def test_pages_import_export(app, tmp_path):
+    source = tmp_path / 'pages.jsonl'
+    pages = [
+        {'name': 'Первая', 'content': "<img src='a.png'>"},
+        {'name': 'Вторая', 'path': '/second', 'content': None},
+        # Путь уже занят, страница пропускается
+        {'name': 'Повтор', 'path': '/second', 'content': 'x'}
+    ]
+    source.write_text(
+        ''.join(json.dumps(page, ensure_ascii=False) + '\n' for page in pages),
+        encoding='utf-8'
+    )
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['pages', 'import', str(source)])
+    assert 'Добавлено страниц: 2' in result.output
+
+    target = tmp_path / 'pages.csv'
+    result = runner.invoke(args=['pages', 'export', str(target)])
+    assert result.exit_code == 0
+
+    with target.open(encoding='utf-8', newline='') as file:
+        exported = {row['path']: row for row in csv.DictReader(file)}
+
+    assert exported['/second']['name'] == 'Вторая'
+    assert 'Первая' in {row['name'] for row in exported.values()}
+
+    # Все выгруженные пути уже есть в базе
+    result = runner.invoke(args=['pages', 'import', str(target)])
+    assert 'Добавлено страниц: 0' in result.output
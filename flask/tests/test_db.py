@@ -0,0 +1,341 @@
+import io
+import sqlite3
+import threading
+
+import pytest
+import flask
+from PIL import Image
+
+import config.config
+import rstapp
+import _celery.tasks as ctasks
+from cache import Generation
+from db import rows
+from db import adapter
+from db.hashing import HASHER, PasswordHasher
+from db.pool import SQLitePool, connect
+from db.trace import TRACE, TracedConnection
+from db.pics import (
+    PICS,
+    PNG_SIGNATURE,
+    BadPicture,
+    PicStore,
+    read_png_size
+)
+
+
+@pytest.mark.parametrize('factory', ['namedtuple', 'row', 'slots'])
+def test_row_factory(factory):
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = rows.get_factory(factory)
+
+    first, second = connection.execute(
+            "SELECT 1 AS id, 'a' AS name UNION SELECT 2, 'b'").fetchall()
+
+    assert first['name' if factory == 'row' else 1] == 'a'
+    assert second[0] == 2
+
+
+def test_row_type_cached():
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = rows.get_factory('namedtuple')
+
+    first, second = connection.execute(
+            'SELECT 1 AS id UNION SELECT 2').fetchall()
+
+    assert type(first) is type(second)
+
+
+def test_render_content():
+    content = "<img src='a.png'> a.png <img alt='b' src=\"b.png\">"
+
+    with flask.Flask(__name__).test_request_context():
+        html = adapter._render_content(content)
+
+    assert html == ("<img src='/static/a.png'> a.png "
+                    '<img alt=\'b\' src="/static/b.png">')
+
+
+def test_render_cached():
+    with flask.Flask(__name__).test_request_context():
+        first = adapter._render_cached('/page', "<img src='a.png'>")
+        changed = adapter._render_cached('/page', "<img src='b.png'>")
+
+    assert first == "<img src='/static/a.png'>"
+    assert changed == "<img src='/static/b.png'>"
+
+
+def test_pool_reuses_connections(tmp_path):
+    pool = SQLitePool(
+        lambda: connect(str(tmp_path / 'test.db'), {'journal_mode': 'WAL'}),
+        size=1,
+        timeout=0.01,
+        check_after=0
+    )
+
+    connection = pool.acquire()
+
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+
+    pool.release(connection)
+
+    assert pool.acquire() is connection
+    assert pool.stats()['hits'] == 1
+
+
+def test_pool_waiter_wakes_on_discard(tmp_path):
+    pool = SQLitePool(
+        lambda: connect(str(tmp_path / 'test.db'), {}),
+        size=1,
+        timeout=5,
+        check_after=0
+    )
+    old = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+
+    waiter.start()
+    # Соединение прошлого поколения закроется при возврате, и его место
+    # займет ожидающий
+    pool.clear()
+    pool.release(old)
+    waiter.join(timeout=1)
+
+    assert acquired and acquired[0] is not old
+    assert pool.stats()['opened'] == 1
+
+
+def _png_header(width, height):
+    return PNG_SIGNATURE + b'\x00\x00\x00\x0dIHDR' \
+            + width.to_bytes(4, 'big') + height.to_bytes(4, 'big')
+
+
+def test_read_png_size():
+    header = _png_header(640, 480)
+
+    assert read_png_size(header) == (640, 480)
+    assert read_png_size(b'GIF89a' + header[6:]) is None
+    assert read_png_size(header[:10]) is None
+
+
+def test_pic_upload(tmp_path):
+    app = flask.Flask(__name__)
+    app.config['USR_PIC_DIR'] = tmp_path / 'pics'
+    store = PicStore()
+    store.init_app(app)
+    data = _png_header(64, 64) + b'\x00' * 100
+
+    with store.upload(1024, 256) as upload:
+        # Заголовок приходит по частям
+        for start in range(0, len(data), 7):
+            upload.write(data[start:start + 7])
+
+        digest = upload.commit()
+
+    assert store.path(digest).read_bytes() == data
+
+    with pytest.raises(BadPicture), store.upload(64, 256) as upload:
+        upload.write(data)
+
+    with pytest.raises(BadPicture), store.upload(1024, 32) as upload:
+        upload.write(data)
+
+    # Временные файлы удалены
+    assert not list((tmp_path / 'pics').glob('*.tmp'))
+
+
+def test_make_usr_thumbs_worker_app(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.config, 'USR_PIC_DIR', tmp_path / 'pics')
+    # Хранилище сайта: у сайта свой instance_path
+    site = flask.Flask(__name__, instance_path=str(tmp_path / 'site'))
+    site.config.from_object('config.config')
+    store = PicStore()
+    store.init_app(site)
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (512, 300)).save(buffer, 'PNG')
+    digest = store.put(buffer.getvalue())
+
+    # Задача выполняется в приложении работника, как в Celery
+    worker = rstapp.create_app()
+    ctasks.make_usr_thumbs(digest)
+
+    for size in worker.config['USR_PIC_SIZES']:
+        with Image.open(store.path(digest, size)) as thumb:
+            assert max(thumb.size) == min(size, 512)
+
+
+def test_traced_connection():
+    TRACE.stats.clear()
+    connection = connect(':memory:', {}, factory=TracedConnection)
+
+    for _ in range(3):
+        connection.execute('SELECT ?', (1,)).fetchone()
+
+    stats = TRACE.stats.get()['SELECT ?']
+    assert stats['count'] == 3
+    assert sum(stats['buckets'].values()) == 3
+
+
+def test_get_page_paths():
+    names = ['Главная', 'О сайте', 'строка\nдве']
+
+    assert adapter._get_page_paths(names) == [
+            adapter._get_page_path(name) for name in names]
+    assert adapter._get_page_paths(names[:2]) == [
+            adapter._get_page_path(name) for name in names[:2]]
+    assert adapter._get_page_paths([]) == []
+
+
+@pytest.mark.parametrize('factory', list(rows.ROW_FACTORIES))
+def test_sqlite_adapter_rows(app, tmp_path, factory):
+    app.config.update({
+        'DB_ADAPTER': 'sqlite',
+        'DB_PATH': tmp_path / 'rows.db',
+        'DB_ROW_FACTORY': factory
+    })
+    adapter.SQLiteAdpt.init_pool(app.config)
+
+    with app.test_request_context():
+        adapter.SQLiteAdpt.recreate()
+        adapter.SQLiteAdpt.add_page('page', "<img src='a.png'>", '/page')
+        adapter.SQLiteAdpt.add_user('rows@mail.com', '123456', True)
+
+        page = adapter.SQLiteAdpt.get_page('page')
+        user = adapter.SQLiteAdpt.get_user(
+                email='rows@mail.com', passwd='123456')
+
+    assert page.html == "<img src='/static/a.png'>"
+    assert user['email'] == 'rows@mail.com'
+
+
+def test_sqlite_init_creates_db(app, tmp_path):
+    app.config.update({
+        'DB_ADAPTER': 'sqlite',
+        'DB_PATH': tmp_path / 'instance' / 'new.db'
+    })
+    adapter.init(app)
+
+    # Выгрузка не глотает ошибки: читатель mode=ro не открыл бы базу
+    # без файла
+    with app.app_context():
+        assert list(adapter.SQLiteAdpt.export_pages()) == []
+
+
+class _MenuAdapter(adapter.DBAdapter):
+    menu_reads = 0
+
+    @classmethod
+    def _get_menu(cls):
+        cls.menu_reads += 1
+        return [('/page', 'page')]
+
+    @classmethod
+    def _add_page(cls, path, name, content, html):
+        return True
+
+    @classmethod
+    def _add_pages(cls, pages):
+        return len(pages)
+
+
+def test_menu_cache(monkeypatch):
+    monkeypatch.setattr(adapter.DBAdapter, '_menu', None)
+    monkeypatch.setattr(adapter.DBAdapter, '_menu_gen', Generation('test'))
+    app = flask.Flask(__name__)
+    app.config['PAGE_IMPORT_BATCH'] = 10
+
+    with app.test_request_context():
+        menu = _MenuAdapter.get_menu()
+
+        # Второй вызов не обращается к базе
+        assert _MenuAdapter.get_menu() is menu
+        assert _MenuAdapter.menu_reads == 1
+
+        # Добавление страницы сбрасывает кэш
+        _MenuAdapter.add_page('new', None, '/new')
+        _MenuAdapter.get_menu()
+        assert _MenuAdapter.menu_reads == 2
+
+        _MenuAdapter.import_pages([{'name': 'more', 'path': '/more'}])
+        _MenuAdapter.get_menu()
+        _MenuAdapter.get_menu()
+        assert _MenuAdapter.menu_reads == 3
+
+
+def test_hash_many():
+    app = flask.Flask(__name__)
+    app.config.from_object('config.config')
+    app.config['PASSWD_HASH_METHOD'] = 'pbkdf2:sha256:1'
+    hasher = PasswordHasher()
+    hasher.init_app(app)
+
+    first, second = hasher.hash_many(['first', 'second'])
+
+    assert hasher.check(first, 'first')
+    assert not hasher.check(second, 'first')
+
+
+@pytest.mark.parametrize(
+        'db_adapter', [adapter.SQLiteAdpt, adapter.AlchemyAdpt])
+def test_add_users(app, tmp_path, db_adapter):
+    app.config.update({
+        'DB_PATH': tmp_path / 'users.db',
+        # Несколько пачек на импорт
+        'USER_IMPORT_BATCH': 2,
+        'PASSWD_HASH_METHOD': 'pbkdf2:sha256:1'
+    })
+    adapter.SQLiteAdpt.init_pool(app.config)
+    HASHER.init_app(app)
+    users = [(f'{i}@mail.com', 'passwd', i % 2 == 0) for i in range(5)]
+
+    with app.test_request_context():
+        db_adapter.recreate()
+
+        # Почта, повторенная в пачке и в базе, пропускается
+        assert db_adapter.add_users(
+                users + [('0@mail.com', 'other', False)]) == 5
+        assert db_adapter.add_users(users[:1]) == 0
+        assert db_adapter.add_users(
+                [('hashed@mail.com', HASHER.hash('hashed'), True)],
+                hashed=True) == 1
+
+        assert db_adapter.get_user(email='0@mail.com', passwd='other') is None
+        assert db_adapter.get_user(email='hashed@mail.com', passwd='hashed')
+        user = db_adapter.get_user(email='4@mail.com', passwd='passwd')
+        assert db_adapter.load_user(user.get_id())['is_male']
+
+
+def test_sqlite_adds_new_columns(app, tmp_path):
+    db_path = tmp_path / 'old.db'
+    # База, созданная старой схемой
+    connection = sqlite3.connect(db_path)
+    connection.executescript("""
+        CREATE TABLE Page (path TEXT PRIMARY KEY, name TEXT NOT NULL,
+                           content TEXT);
+        INSERT INTO Page VALUES ('/old', 'old', '<img src="a.png">');
+        CREATE TABLE User (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                           email TEXT NOT NULL UNIQUE, passwd TEXT NOT NULL,
+                           time INTEGER NOT NULL, picture BLOB DEFAULT NULL);
+        INSERT INTO User VALUES (NULL, 'old@mail.com', '', 0, x'89504e47');
+    """)
+    connection.close()
+
+    app.config.update({
+        'DB_ADAPTER': 'sqlite',
+        'DB_PATH': db_path,
+        'USR_PIC_DIR': tmp_path / 'pics'
+    })
+    PICS.init_app(app)
+    adapter.init(app)
+
+    with app.test_request_context():
+        page = adapter.SQLiteAdpt.get_page('old')
+        assert page.html == '<img src="/static/a.png">'
+        assert adapter.SQLiteAdpt.add_page('new', None, '/new')
+
+        user = adapter.SQLiteAdpt.get_user(email='old@mail.com')
+        assert PICS.path(user['pic_hash']).read_bytes() == b'\x89PNG'
+        assert adapter.SQLiteAdpt.set_usr_pic(user.get_id(), 'a' * 64)
+        assert adapter.SQLiteAdpt.add_user('new@mail.com', '123456', True)[0]
@@ -0,0 +1,41 @@
+import json
+import logging
+import queue
+import sys
+
+from logs import JSONFormatter, _QueueHandler
+
+
+class _RequestOnly:
+    """Как прокси Flask: значение доступно только в своем потоке."""
+
+    def __init__(self):
+        self.resolved = False
+
+    def __str__(self):
+        if self.resolved:
+            raise RuntimeError('Working outside of request context')
+
+        return 'session'
+
+
+def test_queue_handler_formats_in_caller():
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    proxy = _RequestOnly()
+
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = logging.LogRecord(
+            'main.test', logging.ERROR, __file__, 1,
+            'user with %s', (proxy,), sys.exc_info()
+        )
+
+    handler.handle(record)
+    # Контекст запроса закончился до того, как запись выведена
+    proxy.resolved = True
+    data = json.loads(JSONFormatter().format(records.get_nowait()))
+
+    assert data['message'] == 'user with session'
+    assert 'ValueError: boom' in data['exc']
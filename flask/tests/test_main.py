@@ -1,3 +1,5 @@
+from http import HTTPStatus
+
 from .conftest import USR_DATA
 
 
@@ -49,4 +51,27 @@ from .conftest import USR_DATA
 #        })
 #
 #        assert response.status_code == 302
-#        assert DB_ADAPTER.get_user(id=user.get_id())['picture'] is not None
+#        assert DB_ADAPTER.get_user(id=user.get_id())['pic_hash'] is not None
+
+
+def test_default_usr_pic_conditional(client):
+    # Пользователя нет, поэтому отдается картинка по умолчанию
+    response = client.get('/usr_pic/0')
+    last_modified = response.headers['Last-Modified']
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.content_type == 'image/png'
+
+    response = client.get('/usr_pic/0', headers={
+        'if-modified-since': last_modified
+    })
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers['Last-Modified'] == last_modified
+
+    response = client.get('/usr_pic/0', headers={
+        'if-none-match': response.headers['ETag']
+    })
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers['Last-Modified'] == last_modified
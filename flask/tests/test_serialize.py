@@ -0,0 +1,92 @@
+import json
+
+from db.models import Page, UserModel
+from api.serialize import get_plan
+import _celery.tasks as ctasks
+import rstapp
+from db.models import ALCHEMY
+
+
+def test_plan_columns():
+    plan = get_plan(UserModel)
+
+    assert 'pic_hash' in plan.columns
+    assert 'passwd' not in plan.columns
+    assert plan.pk.name == 'id'
+
+
+def test_encode_layouts():
+    plan = get_plan(Page)
+    rows = [('/a', 'A', None, ''), ('/b', 'B', 'b', 'b')]
+
+    records = json.loads(''.join(plan.encode(rows, 'records', 2)))
+    columnar = json.loads(''.join(plan.encode(rows, 'columnar', 3)))
+
+    assert records['result'][1] == dict(zip(plan.columns, rows[1]))
+    assert records['next_cursor'] == '/b'
+    assert columnar['result']['name'] == ['A', 'B']
+    assert columnar['next_cursor'] is None
+
+
+def test_calc_user_hides_passwd(app, user, monkeypatch):
+    chunks = []
+    # Части, которые задача опубликовала бы как PROGRESS
+    monkeypatch.setattr(
+        ctasks.calc_user,
+        'update_state',
+        lambda state, meta: chunks.append(meta['rows'])
+    )
+
+    with app.app_context():
+        result = json.loads(ctasks.calc_user.run('UserModel', 10))
+
+    assert chunks
+    rows = [row for chunk in chunks for row in chunk] + result['result']
+    assert all('passwd' not in row for row in rows)
+
+
+def test_calc_user_worker_app(monkeypatch):
+    # Приложение работника Celery, без модулей app.py
+    app = rstapp.create_app()
+    chunks = []
+    monkeypatch.setattr(
+        ctasks.calc_user,
+        'update_state',
+        lambda state, meta: chunks.append(meta['rows'])
+    )
+
+    with app.app_context():
+        ALCHEMY.create_all()
+
+    # Вызов задачи, как в работнике: FlaskTask сам создаст контекст
+    result = json.loads(ctasks.calc_user('Page', 10))
+
+    assert result['error'] is None
+    assert [row for chunk in chunks for row in chunk] == result['result']
+
+
+def test_rows_view_layouts(client):
+    records = client.get('/api/db/page/5/rows').json
+    columnar = client.get('/api/db/page/5/rows?layout=columnar').json
+
+    assert records['result']
+    assert columnar['result']['name'] == [
+            row['name'] for row in records['result']]
+    assert client.get('/api/db/page/5/rows?layout=xml').status_code == 400
+
+
+def test_rows_view_cursor(client):
+    paths = []
+    url = '/api/db/page/1/rows'
+    response = client.get(url).json
+
+    # Каждая полная страница дает курсор следующей
+    while response['next_cursor'] is not None:
+        paths.append(response['result'][0]['path'])
+        assert response['next_cursor'] == paths[-1]
+        response = client.get(
+                url, query_string={'cursor': response['next_cursor']}).json
+
+    assert response['result'] == []
+    assert len(paths) >= 2 and paths == sorted(paths)
+    assert client.get('/api/db/user/1/rows?cursor=abc').status_code == 400
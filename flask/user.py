@@ -1,6 +1,20 @@
+from typing import NamedTuple
+
 from flask_login import UserMixin
 
 
+class SessionUser(NamedTuple):
+    """Данные пользователя, которые нужны страницам сессии.
+
+    Без хэша пароля и картинки. Экземпляр неизменяемый, поэтому его
+    можно хранить в кэше и отдавать разным запросам.
+    """
+    id: int
+    email: str
+    time: int
+    is_male: bool | None
+
+
 # https://github.com/maxcountryman/flask-login/blob/main/src/flask_login/mixins.py#L1
 # К экземпляру можно получить доступ при помощи flask_login.current_user
 class User(UserMixin):
@@ -11,10 +25,14 @@ class User(UserMixin):
         # Обязательно возвращает строку
         # Этот id вставляется в сессию, затем оттуда передается в
         # user_loader
-        return self.__row.id
+        return self['id']
 
     def __getitem__(self, key):
-        return getattr(self.__row, key)
+        # sqlite3.Row не поддерживает доступ по атрибутам
+        try:
+            return getattr(self.__row, key)
+        except AttributeError:
+            return self.__row[key]
 
     #def is_authenticated(self):
     #    # True, если пользователь авторизован
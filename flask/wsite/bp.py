@@ -1,4 +1,6 @@
 import time
+import hashlib
+from datetime import datetime, timezone
 from operator import itemgetter
 from pathlib import Path
 import logging
@@ -8,11 +10,14 @@ from threading import Thread
 import flask
 from flask import Blueprint, current_app
 import flask_login
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import is_resource_modified
 
 from utils import with_form
+from db.pics import PICS, BadPicture
+import _celery.tasks as ctasks
 
 LOGGER: Final = logging.getLogger('main.' + __name__)
-LOGGER.setLevel(logging.DEBUG)
 
 WSITE_BP: Final = Blueprint(
     'wsite',
@@ -142,10 +147,6 @@ def handle_profile(uname: str):
     return flask.render_template('profile.html', menu=db_adapter.get_menu())
 
 
-def _verify_usr_pic(name):
-    return name.split('.', 1)[1].lower() == 'png'
-
-
 #@WSITE_BP.put('/upload_usr_pic')
 @WSITE_BP.post('/upload_usr_pic')
 def upload_usr_pic():
@@ -155,7 +156,10 @@ def upload_usr_pic():
     # Файлы помещаются в files, а не form
     # Доступ к files возможен только когда форма кодировалась в
     # multipart/form-data
-    picture = flask.request.files['picture']
+    # picture = flask.request.files['picture']
+    # Но request.files сначала сохраняет весь файл в память или во
+    # временный файл, и только потом его можно проверить. Поэтому форму
+    # разбираем сами, а файл пишется сразу в хранилище картинок.
 
     # Следует соблюдать принцип: never trust user input
     # Если бы мы сохраняли файл в файловую систему, используя имя
@@ -163,33 +167,118 @@ def upload_usr_pic():
     # werkzeug.utils.secure_filename(filename), чтобы преобразовать
     # строку к безопасному имени файла
     # https://flask.palletsprojects.com/en/2.2.x/patterns/fileuploads/#a-gentle-introduction
+    # Мы используем хэш содержимого, поэтому имя файла не важно
+
+    # Расширение в имени файла ничего не гарантирует, поэтому PicUpload
+    # проверяет заголовок PNG и размер по мере поступления данных
+    request = flask.request
+    config = current_app.config
+
+    with PICS.upload(
+        config['USR_PIC_MAX_SIZE'], config['USR_PIC_MAX_DIM']
+    ) as upload:
+        parser = FormDataParser(
+            upload.stream_factory,
+            max_content_length=request.max_content_length,
+            # Иначе ошибки разбора не дойдут до нас
+            silent=False
+        )
+
+        try:
+            parser.parse(
+                request.stream,
+                request.mimetype,
+                request.content_length,
+                request.mimetype_params
+            )
+            # В базе сохраняется только хэш картинки
+            pic_hash = upload.commit()
+        except BadPicture as error:
+            flask.flash(str(error))
+            return flask.redirect(flask.url_for('auth.handle_login'))
 
     db_adapter = current_app.extensions['db_adapter']
-
-    if _verify_usr_pic(picture.filename):
-        db_adapter.set_usr_pic(
-                flask_login.current_user.get_id(), picture.read())
-    else:
-        flask.flash('Поддерживается только PNG')
+    db_adapter.set_usr_pic(flask_login.current_user.get_id(), pic_hash)
+    ctasks.make_usr_thumbs.delay(pic_hash)
 
     return flask.redirect(flask.url_for('auth.handle_login'))
 
 
+# Вызывается один раз при регистрации блюпринта в приложении
+@WSITE_BP.record_once
+def load_default_usr_pic(state: flask.blueprints.BlueprintSetupState):
+    # Картинка по умолчанию читается один раз, а не на каждый запрос
+    #default_path = os.path.join('static', 'user.png')
+    default_path = Path('static') / 'user.png'
+    with state.app.open_resource(default_path) as pic_file:
+        pic_data = pic_file.read()
+
+    state.app.extensions['default_usr_pic'] = (
+        pic_data,
+        hashlib.sha256(pic_data).hexdigest(),
+        (Path(state.app.root_path) / default_path).stat().st_mtime
+    )
+
+
+# Браузер сохраняет картинку вместе с ETag (здесь это хэш содержимого) и
+# Last-Modified и в следующий раз отправляет их в заголовках
+# If-None-Match и If-Modified-Since. Если картинка не изменилась, то
+# отвечаем 304 Not Modified без тела.
+def _send_usr_pic(etag: str, mtime: float, send) -> flask.Response:
+    # В HTTP-дате нет долей секунды
+    last_modified = datetime.fromtimestamp(int(mtime), timezone.utc)
+
+    # If-None-Match проверяется первым, If-Modified-Since -- только без
+    # него
+    if not is_resource_modified(
+            flask.request.environ, etag=etag, last_modified=last_modified):
+        # Сам файл даже не открывается
+        response = flask.Response(status=304)
+    else:
+        response = send()
+        response.content_type = 'image/png'
+
+    response.set_etag(etag)
+    # Заголовок нужен и в ответе 304, иначе кэш может его потерять
+    response.last_modified = last_modified
+    # Картинку можно хранить в любом кэше, но недолго, так как по
+    # тому же адресу может появиться новая
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['USR_PIC_MAX_AGE']
+    return response
+
+
 @WSITE_BP.get('/usr_pic/<id_>')
 def get_usr_pic(id_):
     db_adapter = current_app.extensions['db_adapter']
     user = db_adapter.get_user(id=id_)
-    pic_data = user['picture']
 
-    if not pic_data:
-        #default_path = os.path.join('static', 'user.png')
-        default_path = Path('static') / 'user.png'
-        with current_app.open_resource(default_path) as pic_file:
-            pic_data = pic_file.read()
+    if user and user['pic_hash']:
+        pic_hash = user['pic_hash']
+        # ?size=64 -- миниатюра, если она уже построена
+        size = flask.request.args.get('size', type=int)
+        etag = pic_hash
 
-    response = flask.make_response(pic_data)
-    response.headers['content-type'] = 'image/png'
-    return response
+        if size in current_app.config['USR_PIC_SIZES'] \
+                and PICS.exists(pic_hash, size):
+            etag = f'{pic_hash}-{size}'
+        else:
+            size = None
+
+        path = PICS.path(pic_hash, size)
+
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return flask.abort(404)
+
+        # WSGI-сервер может отдать файл через sendfile, не читая его в
+        # память процесса
+        return _send_usr_pic(
+                etag, mtime, lambda: flask.send_file(path, etag=False))
+
+    pic_data, etag, mtime = current_app.extensions['default_usr_pic']
+    return _send_usr_pic(etag, mtime, lambda: flask.make_response(pic_data))
 
 
 def print_url_for():  # представление для обработки запроса
@@ -0,0 +1 @@
+../flask/cache.py
\ No newline at end of file
@@ -0,0 +1 @@
+../flask/user.py
\ No newline at end of file